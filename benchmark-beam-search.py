@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+from tqdm import tqdm
+
+import hw_asr.model as module_model
+from hw_asr.datasets.utils import get_dataloaders
+from hw_asr.frontend import LogMelFrontend
+from hw_asr.metric.utils import calc_wer, calc_cer
+from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+from hw_asr.text_encoder.prefix_beam_search import ctc_prefix_beam_search
+from hw_asr.trainer import Trainer
+from hw_asr.utils import ROOT_PATH
+from hw_asr.utils.parse_config import ConfigParser
+
+DEFAULT_CHECKPOINT_PATH = ROOT_PATH / "default_test_model" / "checkpoint.pth"
+
+
+def compute_log_probs(config, text_encoder):
+    """
+    (log-probs, target text) of every record of the test set, computed once for all decoders
+    """
+    logger = config.get_logger("benchmark")
+    dataloaders = get_dataloaders(config, text_encoder)
+
+    model = config.init_obj(config["arch"], module_model, n_class=len(text_encoder))
+    logger.info("Loading checkpoint: {} ...".format(config.resume))
+    checkpoint = torch.load(config.resume)
+    if config["n_gpu"] > 1:
+        model = torch.nn.DataParallel(model)
+    model.load_state_dict(checkpoint["state_dict"])
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = model.to(device)
+    model.eval()
+
+    frontend = None
+    if config["preprocessing"].get("batch_frontend", False):
+        frontend = LogMelFrontend(config).to(device).eval()
+
+    records = []
+    with torch.no_grad():
+        for batch in tqdm(dataloaders["test"], desc="Computing log-probs"):
+            batch = Trainer.move_batch_to_device(batch, device)
+            if frontend is not None:
+                batch.update(frontend(**batch))
+            output = model(**batch)
+            logits = output["logits"] if type(output) is dict else output
+            log_probs = torch.log_softmax(logits, dim=-1).cpu()
+            log_probs_length = model.transform_input_lengths(batch["spectrogram_length"]).cpu()
+            for i, text in enumerate(batch["text"]):
+                records.append((log_probs[i, :int(log_probs_length[i])].numpy(), text))
+    return records
+
+
+def benchmark(name, decode, records):
+    wers, cers = [], []
+    start = time.perf_counter()
+    predictions = [decode(log_probs) for log_probs, _ in records]
+    elapsed = time.perf_counter() - start
+    for pred, (_, target) in zip(predictions, records):
+        target = CTCCharTextEncoder.normalize_text(target)
+        wers.append(calc_wer(target, pred.strip()))
+        cers.append(calc_cer(target, pred.strip()))
+    print(f"{name}: {elapsed:.2f}s ({elapsed / len(records) * 1000:.1f} ms per record); "
+          f"WER: {sum(wers) / len(wers):.4f}; CER: {sum(cers) / len(cers):.4f}")
+
+
+def main(config, beam_size, top_k, cutoff_prob, blank_skip_threshold):
+    text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+    records = compute_log_probs(config, text_encoder)
+    print(f"{len(records)} records, beam size {beam_size}")
+
+    token_chars, _ = text_encoder._get_token_lut()
+    blank = text_encoder.char2ind[text_encoder.EMPTY_TOK]
+
+    def native(**kwargs):
+        def decode(log_probs):
+            tokens, _ = ctc_prefix_beam_search(log_probs, beam_size=beam_size, blank=blank, **kwargs)[0]
+            return "".join(token_chars[tokens].tolist())
+        return decode
+
+    benchmark("pyctcdecode", lambda log_probs: text_encoder.decoder.decode(log_probs, beam_width=beam_size), records)
+    benchmark("prefix beam search", native(), records)
+    benchmark(
+        f"prefix beam search (top_k={top_k}, cutoff_prob={cutoff_prob}, blank_skip={blank_skip_threshold})",
+        native(top_k=top_k, cutoff_prob=cutoff_prob, blank_skip_threshold=blank_skip_threshold),
+        records,
+    )
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Compare speed and WER of CTC beam search decoders")
+    args.add_argument(
+        "-c",
+        "--config",
+        default=None,
+        type=str,
+        help="config file path (default: None)",
+    )
+    args.add_argument(
+        "-r",
+        "--resume",
+        default=str(DEFAULT_CHECKPOINT_PATH.absolute().resolve()),
+        type=str,
+        help="path to latest checkpoint (default: None)",
+    )
+    args.add_argument(
+        "-d",
+        "--device",
+        default=None,
+        type=str,
+        help="indices of GPUs to enable (default: all)",
+    )
+    args.add_argument(
+        "-t",
+        "--test-data-folder",
+        default=None,
+        type=str,
+        help="Path to dataset",
+    )
+    args.add_argument(
+        "-b",
+        "--batch-size",
+        default=20,
+        type=int,
+        help="Test dataset batch size",
+    )
+    args.add_argument(
+        "--beam-size",
+        default=100,
+        type=int,
+        help="Beam width of all decoders",
+    )
+    args.add_argument(
+        "--top-k",
+        default=10,
+        type=int,
+        help="Tokens per frame of the pruned prefix beam search",
+    )
+    args.add_argument(
+        "--cutoff-prob",
+        default=0.999,
+        type=float,
+        help="Cumulative probability cutoff of the pruned prefix beam search",
+    )
+    args.add_argument(
+        "--blank-skip-threshold",
+        default=0.999,
+        type=float,
+        help="Blank probability above which the pruned prefix beam search skips a frame",
+    )
+
+    args = args.parse_args()
+
+    # set GPUs
+    if args.device is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = args.device
+
+    # model config is located with checkpoint in the same folder
+    model_config = Path(args.resume).parent / "config.json"
+    with model_config.open() as f:
+        config = ConfigParser(json.load(f), resume=args.resume)
+
+    # update with addition configs from `args.config` if provided
+    if args.config is not None:
+        with Path(args.config).open() as f:
+            config.config.update(json.load(f))
+
+    if args.test_data_folder is not None:
+        test_data_folder = Path(args.test_data_folder).absolute().resolve()
+        assert test_data_folder.exists()
+        config.config["data"] = {
+            "test": {
+                "batch_size": args.batch_size,
+                "num_workers": 1,
+                "datasets": [
+                    {
+                        "type": "CustomDirAudioDataset",
+                        "args": {
+                            "audio_dir": str(test_data_folder / "audio"),
+                            "transcription_dir": str(test_data_folder / "transcriptions"),
+                        },
+                    }
+                ],
+            }
+        }
+
+    assert config.config.get("data", {}).get("test", None) is not None
+    config["data"]["test"]["batch_size"] = args.batch_size
+
+    main(config, args.beam_size, args.top_k, args.cutoff_prob, args.blank_skip_threshold)
@@ -1,9 +1,9 @@
-from collections import Callable
-from typing import List
+from typing import Callable, List
 
+import hw_asr.augmentations.batch_augmentations
 import hw_asr.augmentations.spectrogram_augmentations
 import hw_asr.augmentations.wave_augmentations
-from hw_asr.augmentations.sequential import SequentialAugmentation
+from hw_asr.augmentations.sequential import SequentialAugmentation, BatchSequentialAugmentation
 from hw_asr.utils.parse_config import ConfigParser
 
 
@@ -24,6 +24,48 @@ def from_configs(configs: ConfigParser):
     return _to_function(wave_augs), _to_function(spec_augs)
 
 
+def batch_from_configs(configs: ConfigParser):
+    """
+    Batch augmentations applied by the trainer after collation:
+    `batch_wave` ones work on padded waveforms (needs `preprocessing.batch_frontend`),
+    `batch_spectrogram` ones on padded spectrograms.
+    """
+    batch_augs = {"batch_wave": [], "batch_spectrogram": []}
+    for key, augs in batch_augs.items():
+        if "augmentations" in configs.config and key in configs.config["augmentations"]:
+            for aug_dict in configs.config["augmentations"][key]:
+                augs.append(
+                    configs.init_obj(aug_dict, hw_asr.augmentations.batch_augmentations)
+                )
+    return _to_batch_function(batch_augs["batch_wave"]), _to_batch_function(batch_augs["batch_spectrogram"])
+
+
+def batch_spec_from_configs(configs: ConfigParser):
+    """
+    Batched versions (`Batch<type>`) of `spectrogram` augmentations, for spectrograms that
+    are computed for the whole batch by the batch frontend
+    """
+    augs = []
+    if "augmentations" in configs.config and "spectrogram" in configs.config["augmentations"]:
+        for aug_dict in configs.config["augmentations"]["spectrogram"]:
+            batch_type = "Batch" + aug_dict["type"]
+            assert hasattr(hw_asr.augmentations.batch_augmentations, batch_type), \
+                f"{aug_dict['type']} has no batched version {batch_type}, it can't be used with a batch frontend"
+            augs.append(
+                configs.init_obj({**aug_dict, "type": batch_type}, hw_asr.augmentations.batch_augmentations)
+            )
+    return _to_batch_function(augs)
+
+
+def _to_batch_function(augs_list: List[Callable]):
+    if len(augs_list) == 0:
+        return None
+    elif len(augs_list) == 1:
+        return augs_list[0]
+    else:
+        return BatchSequentialAugmentation(augs_list)
+
+
 def _to_function(augs_list: List[Callable]):
     if len(augs_list) == 0:
         return None
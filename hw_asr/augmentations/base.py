@@ -1,6 +1,19 @@
+from typing import Tuple
+
 from torch import Tensor
 
 
 class AugmentationBase:
     def __call__(self, data: Tensor) -> Tensor:
         raise NotImplementedError
+
+
+class BatchAugmentationBase:
+    """
+    Augmentation of a whole padded batch, applied after collation.
+    Every record of the batch gets its own random parameters, `lengths` mark the valid part of each record.
+    Returns augmented batch and its (possibly changed) lengths.
+    """
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        raise NotImplementedError
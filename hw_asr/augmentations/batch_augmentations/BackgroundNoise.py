@@ -0,0 +1,35 @@
+from typing import Tuple
+
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import BatchAugmentationBase
+from hw_asr.augmentations.batch_augmentations.utils import random_apply_mask, length_mask
+from hw_asr.augmentations.noise_bank import NoiseBank, mix_at_snr
+
+
+class BatchBackgroundNoise(BatchAugmentationBase):
+    """
+    Mixes random crops of a memory mapped noise corpus into a batch, every record gets its own SNR.
+    """
+
+    def __init__(self, blob_path: str, prob: float, sr: int = 16000, noise_path: str = None,
+                 min_snr_db: float = 5.0, max_snr_db: float = 20.0, *args, **kwargs):
+        self.bank = NoiseBank(blob_path, sr, noise_path)
+        self.min_snr_db = min_snr_db
+        self.max_snr_db = max_snr_db
+        self.prob = prob
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        :param data: (batch, time) padded waveforms
+        """
+        records = torch.nonzero(random_apply_mask(self.prob, data.shape[0], data.device)).flatten()
+        if len(records) == 0:
+            return data, lengths
+        data = data.clone()
+        noise = self.bank.crop(len(records), data.shape[-1]).to(data.device)
+        snr_db = torch.empty(len(records), device=data.device).uniform_(self.min_snr_db, self.max_snr_db)
+        mask = length_mask(lengths[records].to(data.device), data.shape[-1])
+        data[records] = mix_at_snr(data[records], noise, snr_db, mask)
+        return data, lengths
@@ -0,0 +1,24 @@
+from typing import Tuple
+
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import BatchAugmentationBase
+from hw_asr.augmentations.batch_augmentations.utils import random_apply_mask
+
+
+class BatchGain(BatchAugmentationBase):
+    def __init__(self, min_gain_in_db: float = -18.0, max_gain_in_db: float = 6.0, p: float = 0.5,
+                 *args, **kwargs):
+        self.min_gain_in_db = min_gain_in_db
+        self.max_gain_in_db = max_gain_in_db
+        self.p = p
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        :param data: (batch, time) padded waveforms, padding stays zero after scaling
+        """
+        apply = random_apply_mask(self.p, data.shape[0], data.device)
+        gain_db = torch.empty(data.shape[0], device=data.device).uniform_(self.min_gain_in_db, self.max_gain_in_db)
+        gain = torch.where(apply, 10 ** (gain_db / 20), torch.ones_like(gain_db))
+        return data * gain[:, None], lengths
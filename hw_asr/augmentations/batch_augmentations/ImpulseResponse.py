@@ -0,0 +1,37 @@
+from typing import Tuple
+
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import BatchAugmentationBase
+from hw_asr.augmentations.batch_augmentations.utils import random_apply_mask, length_mask
+from hw_asr.augmentations.ir_bank import ImpulseResponseBank
+
+
+class BatchImpulseResponse(BatchAugmentationBase):
+    """
+    Reverberation of a batch: all selected records are convolved with their impulse
+    responses in one FFT pass, spectra of the bank are cached per FFT size.
+    """
+
+    def __init__(self, ir_path: str, prob: float, sr: int = 16000, cache_path: str = None,
+                 compensate_for_propagation_delay: bool = False, *args, **kwargs):
+        self.bank = ImpulseResponseBank(ir_path, sr, cache_path)
+        self.compensate_for_propagation_delay = compensate_for_propagation_delay
+        self.prob = prob
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        :param data: (batch, time) padded waveforms
+        """
+        records = torch.nonzero(random_apply_mask(self.prob, data.shape[0], data.device)).flatten()
+        if len(records) == 0:
+            return data, lengths
+        data = data.clone()
+        convolved = self.bank.convolve(
+            data[records], self.bank.sample(len(records)), self.compensate_for_propagation_delay
+        )
+        # reverb tails must not leak into padding
+        mask = length_mask(lengths[records].to(data.device), data.shape[-1])
+        data[records] = convolved * mask
+        return data, lengths
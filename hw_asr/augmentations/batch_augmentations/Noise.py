@@ -0,0 +1,23 @@
+from typing import Tuple
+
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import BatchAugmentationBase
+from hw_asr.augmentations.batch_augmentations.utils import random_apply_mask, length_mask
+
+
+class BatchGaussianNoise(BatchAugmentationBase):
+    def __init__(self, mu: float, sigma: float, prob: float, *args, **kwargs):
+        self.mu = mu
+        self.sigma = sigma
+        self.prob = prob
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        :param data: (batch, time) padded waveforms
+        """
+        apply = random_apply_mask(self.prob, data.shape[0], data.device)
+        mask = length_mask(lengths.to(data.device), data.shape[-1]) & apply[:, None]
+        noise = torch.randn_like(data) * self.sigma + self.mu
+        return data + noise * mask, lengths
@@ -0,0 +1,45 @@
+from typing import Tuple
+
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import BatchAugmentationBase
+from hw_asr.augmentations.batch_augmentations.utils import random_apply_mask
+
+
+def _random_band(max_width: int, size: Tensor, batch_size: int, device):
+    """
+    Start and end of a random band of width [0, max_width) inside [0, size) for every record
+    """
+    width = (torch.rand(batch_size, device=device) * max_width).long()
+    width = torch.minimum(width, size)
+    start = (torch.rand(batch_size, device=device) * (size - width + 1)).long()
+    return start, start + width
+
+
+class BatchSpecAug(BatchAugmentationBase):
+    def __init__(self, freq_mask: int, time_mask: int, prob: float, *args, **kwargs):
+        self.freq_mask = freq_mask
+        self.time_mask = time_mask
+        self.prob = prob
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        :param data: (batch, time, n_feats) padded spectrograms, like collate_fn gives
+        :param lengths: (batch,) spectrogram lengths, time masks never reach padding
+        """
+        batch_size, max_time, n_feats = data.shape
+        device = data.device
+        apply = random_apply_mask(self.prob, batch_size, device)
+
+        freq_start, freq_end = _random_band(
+            self.freq_mask, torch.full((batch_size,), n_feats, device=device), batch_size, device
+        )
+        time_start, time_end = _random_band(self.time_mask, lengths.to(device).long(), batch_size, device)
+
+        freqs = torch.arange(n_feats, device=device)[None]
+        times = torch.arange(max_time, device=device)[None]
+        freq_masked = (freqs >= freq_start[:, None]) & (freqs < freq_end[:, None])
+        time_masked = (times >= time_start[:, None]) & (times < time_end[:, None])
+        masked = (time_masked[:, :, None] | freq_masked[:, None, :]) & apply[:, None, None]
+        return data.masked_fill(masked, 0), lengths
@@ -0,0 +1,50 @@
+from typing import List, Tuple
+
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import BatchAugmentationBase
+from hw_asr.augmentations.batch_augmentations.utils import random_apply_mask, length_mask
+from hw_asr.augmentations.wave_augmentations.SpeedPerturb import get_speed_resampler
+
+
+class BatchSpeedPerturb(BatchAugmentationBase):
+    """
+    Speed perturbation of a batch: records with the same rate are resampled together
+    with a cached kernel, lengths of the batch change accordingly.
+    """
+
+    def __init__(self, rates: List[float], sr: int = 16000, prob: float = 1.0, *args, **kwargs):
+        self.rates = rates
+        self.sr = sr
+        self.prob = prob
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        """
+        :param data: (batch, time) padded waveforms
+        """
+        batch_size = data.shape[0]
+        apply = random_apply_mask(self.prob, batch_size, "cpu")
+        rate_ids = torch.randint(len(self.rates), (batch_size,))
+        lengths = lengths.cpu().long()
+
+        outputs = [data[i] for i in range(batch_size)]
+        new_lengths = lengths.clone()
+        for rate_id, rate in enumerate(self.rates):
+            records = torch.nonzero(apply & (rate_ids == rate_id)).flatten()
+            if rate == 1.0 or len(records) == 0:
+                continue
+            resampler = get_speed_resampler(self.sr, rate, data.device)
+            resampled = resampler(data[records])
+            orig_freq, new_freq = resampler.orig_freq, resampler.new_freq
+            for i, record in enumerate(records.tolist()):
+                new_lengths[record] = -(-lengths[record] * new_freq // orig_freq)
+                outputs[record] = resampled[i, :new_lengths[record]]
+
+        result = torch.zeros(batch_size, int(new_lengths.max()), dtype=data.dtype, device=data.device)
+        for i, output in enumerate(outputs):
+            output = output[:new_lengths[i]]
+            result[i, :len(output)] = output
+        # resampled padding may leak past the new length
+        result = result * length_mask(new_lengths.to(data.device), result.shape[-1])
+        return result, new_lengths.int()
@@ -0,0 +1,15 @@
+from hw_asr.augmentations.batch_augmentations.BackgroundNoise import BatchBackgroundNoise
+from hw_asr.augmentations.batch_augmentations.Gain import BatchGain
+from hw_asr.augmentations.batch_augmentations.ImpulseResponse import BatchImpulseResponse
+from hw_asr.augmentations.batch_augmentations.Noise import BatchGaussianNoise
+from hw_asr.augmentations.batch_augmentations.SpecAug import BatchSpecAug
+from hw_asr.augmentations.batch_augmentations.SpeedPerturb import BatchSpeedPerturb
+
+__all__ = [
+    "BatchBackgroundNoise",
+    "BatchGain",
+    "BatchGaussianNoise",
+    "BatchImpulseResponse",
+    "BatchSpecAug",
+    "BatchSpeedPerturb",
+]
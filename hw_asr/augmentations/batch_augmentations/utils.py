@@ -0,0 +1,17 @@
+import torch
+from torch import Tensor
+
+
+def random_apply_mask(prob: float, batch_size: int, device) -> Tensor:
+    """
+    (batch,) bool mask of records the augmentation is applied to
+    """
+    return torch.rand(batch_size, device=device) < prob
+
+
+def length_mask(lengths: Tensor, max_length: int) -> Tensor:
+    """
+    (batch, max_length) bool mask of valid (non-padding) positions
+    """
+    positions = torch.arange(max_length, device=lengths.device)
+    return positions[None] < lengths[:, None]
@@ -0,0 +1,154 @@
+import json
+import logging
+import random
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import torch
+import torchaudio
+from torch import Tensor
+
+from hw_asr.utils import get_resampler
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg")
+
+
+def resolve_paths(paths: Union[str, Path, List[Union[str, Path]]]) -> List[str]:
+    """
+    Absolute paths of a path or a list of them, stored in cache metadata to detect a changed source
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    return [str(Path(path).resolve()) for path in paths]
+
+
+def find_audio_files(paths: Union[str, Path, List[Union[str, Path]]]) -> List[Path]:
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in AUDIO_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def _fft_size(n: int) -> int:
+    # power of two sizes: fast FFTs and only a handful of distinct sizes to cache
+    return 1 << (n - 1).bit_length()
+
+
+class ImpulseResponseBank:
+    """
+    All impulse responses of `ir_path` resampled to `sr` and stored as one zero padded
+    (n_irs, max_ir_length) array. With `cache_path` the array is saved as .npy once
+    and memory mapped afterwards. Parameters of the bank are stored next to it in
+    `<cache_path>.json`, the bank is rebuilt when they change.
+    Convolving a batch is a single rfft of the audio, an rfft of the sampled responses,
+    a product and an irfft. Spectra aren't cached: spectra of the whole bank would take
+    n_irs * n_fft complex numbers for every FFT size.
+    """
+
+    def __init__(self, ir_path, sr: int, cache_path=None, max_ir_length: Optional[float] = None):
+        self.sr = sr
+        self._cache_path = cache_path
+        meta = {
+            "ir_path": resolve_paths(ir_path),
+            "sr": sr,
+            "max_ir_length": max_ir_length,
+        }
+        if cache_path is not None and self._read_cache_meta(cache_path) == meta:
+            self._irs = None
+            self.n_irs, self.ir_length = np.load(str(cache_path), mmap_mode="r").shape
+        else:
+            irs = self._load_irs(ir_path, max_ir_length)
+            if cache_path is not None:
+                if Path(cache_path).exists():
+                    logger.info(f"Impulse response bank {cache_path} was built with other parameters, rebuilding it")
+                np.save(str(cache_path), irs)
+                with Path(f"{cache_path}.json").open("w") as f:
+                    json.dump(meta, f, indent=2)
+            self._irs = irs
+            self.n_irs, self.ir_length = irs.shape
+        logger.info(f"Impulse response bank: {self.n_irs} responses of up to {self.ir_length} samples")
+        self._delays = None
+
+    @staticmethod
+    def _read_cache_meta(cache_path) -> Optional[dict]:
+        meta_path = Path(f"{cache_path}.json")
+        if not Path(cache_path).exists() or not meta_path.exists():
+            return None
+        with meta_path.open() as f:
+            return json.load(f)
+
+    def _load_irs(self, ir_path, max_ir_length) -> np.ndarray:
+        files = find_audio_files(ir_path)
+        assert len(files) > 0, f"No impulse responses found in {ir_path}"
+        irs = []
+        for file in files:
+            ir, sr = torchaudio.load(str(file))
+            ir = ir[0]  # keep the first channel only
+            if sr != self.sr:
+                ir = get_resampler(sr, self.sr)(ir)
+            if max_ir_length is not None:
+                ir = ir[:int(max_ir_length * self.sr)]
+            irs.append(ir.numpy())
+        bank = np.zeros((len(irs), max(len(ir) for ir in irs)), dtype=np.float32)
+        for i, ir in enumerate(irs):
+            bank[i, :len(ir)] = ir
+        return bank
+
+    def _open(self) -> np.ndarray:
+        # the memmap is opened lazily, so that every DataLoader worker maps the file by itself
+        if self._irs is None:
+            self._irs = np.load(str(self._cache_path), mmap_mode="r")
+        return self._irs
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._cache_path is not None:
+            state["_irs"] = None
+        return state
+
+    def __len__(self):
+        return self.n_irs
+
+    def sample(self, n: int) -> Tensor:
+        """
+        Ids of `n` random impulse responses
+        """
+        return torch.tensor(random.choices(range(self.n_irs), k=n), dtype=torch.long)
+
+    def get_fft(self, ir_ids: Tensor, n_fft: int, device) -> Tensor:
+        """
+        (len(ir_ids), n_fft // 2 + 1) spectra of the impulse responses `ir_ids`
+        """
+        irs = torch.from_numpy(np.array(self._open()[ir_ids.cpu().numpy()], dtype=np.float32)).to(device)
+        return torch.fft.rfft(irs, n=n_fft)
+
+    def get_delays(self) -> Tensor:
+        """
+        Propagation delay (position of the absolute peak) of every impulse response
+        """
+        if self._delays is None:
+            self._delays = torch.from_numpy(np.abs(self._open()).argmax(axis=1))
+        return self._delays
+
+    def convolve(self, data: Tensor, ir_ids: Tensor, compensate_for_propagation_delay: bool = False) -> Tensor:
+        """
+        Convolves every row of (batch, time) `data` with its impulse response,
+        output is cut to the input length.
+        """
+        n_samples = data.shape[-1]
+        n_fft = _fft_size(n_samples + self.ir_length - 1)
+        ir_fft = self.get_fft(ir_ids, n_fft, data.device)
+        convolved = torch.fft.irfft(torch.fft.rfft(data, n=n_fft) * ir_fft, n=n_fft)
+        if not compensate_for_propagation_delay:
+            return convolved[..., :n_samples]
+        delays = self.get_delays()[ir_ids.cpu()].to(data.device)
+        positions = delays[:, None] + torch.arange(n_samples, device=data.device)
+        return convolved.gather(-1, positions)
@@ -0,0 +1,112 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchaudio
+from torch import Tensor
+from tqdm import tqdm
+
+from hw_asr.augmentations.ir_bank import find_audio_files, resolve_paths
+from hw_asr.utils import get_resampler
+
+logger = logging.getLogger(__name__)
+
+
+def build_noise_blob(noise_path, blob_path, sr: int):
+    """
+    Decodes (and resamples) all audio files of `noise_path` into one raw int16 PCM file.
+    Sample rate and the resolved `noise_path` are stored next to it in `<blob_path>.json`.
+    """
+    files = find_audio_files(noise_path)
+    assert len(files) > 0, f"No noise files found in {noise_path}"
+    blob_path = Path(blob_path)
+    blob_path.parent.mkdir(exist_ok=True, parents=True)
+    n_samples = 0
+    with blob_path.open("wb") as f:
+        for file in tqdm(files, desc=f"Packing noise into {blob_path}"):
+            wave, file_sr = torchaudio.load(str(file))
+            wave = wave[0:1]
+            if file_sr != sr:
+                wave = get_resampler(file_sr, sr)(wave)
+            samples = (wave.reshape(-1).clamp(-1, 1) * 32767).round().to(torch.int16).numpy()
+            f.write(samples.tobytes())
+            n_samples += len(samples)
+    with Path(f"{blob_path}.json").open("w") as f:
+        json.dump({
+            "sr": sr, "noise_path": resolve_paths(noise_path), "n_files": len(files), "n_samples": n_samples
+        }, f, indent=2)
+    logger.info(f"Packed {len(files)} noise files ({n_samples / sr / 3600:.1f} hours) into {blob_path}")
+
+
+class NoiseBank:
+    """
+    Background noise corpus stored as one memory mapped int16 PCM blob.
+    Crops are read at random offsets, so only the touched pages are ever loaded.
+    If the blob doesn't exist, or was built from another `noise_path` or sample rate,
+    it is built from the audio files of `noise_path`.
+    """
+
+    def __init__(self, blob_path, sr: int, noise_path=None):
+        self.blob_path = Path(blob_path)
+        meta = self._read_meta()
+        if meta is None:
+            assert noise_path is not None, f"Noise blob {blob_path} doesn't exist and no noise_path is given"
+            build_noise_blob(noise_path, self.blob_path, sr)
+        elif noise_path is not None and (meta["sr"] != sr or meta.get("noise_path") != resolve_paths(noise_path)):
+            logger.info(f"Noise blob {blob_path} was built with other parameters, rebuilding it")
+            build_noise_blob(noise_path, self.blob_path, sr)
+        meta = self._read_meta()
+        assert meta["sr"] == sr, f"Noise blob {blob_path} is sampled at {meta['sr']}, not {sr}"
+        self.n_samples = meta["n_samples"]
+        self._blob = None
+
+    def _read_meta(self):
+        meta_path = Path(f"{self.blob_path}.json")
+        if not self.blob_path.exists() or not meta_path.exists():
+            return None
+        with meta_path.open() as f:
+            return json.load(f)
+
+    def _open(self) -> np.ndarray:
+        # the memmap is opened lazily, so that every DataLoader worker maps the file by itself
+        if self._blob is None:
+            self._blob = np.memmap(str(self.blob_path), mode="r", dtype=np.int16)
+        return self._blob
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_blob"] = None
+        return state
+
+    def crop(self, n: int, length: int) -> Tensor:
+        """
+        (n, length) float crops taken at random offsets, the corpus is looped if it's shorter than `length`
+        """
+        blob = self._open()
+        crops = np.empty((n, length), dtype=np.int16)
+        for row, offset in enumerate(np.random.randint(0, self.n_samples, size=n)):
+            filled = 0
+            while filled < length:
+                chunk = blob[offset: offset + length - filled]
+                crops[row, filled: filled + len(chunk)] = chunk
+                filled += len(chunk)
+                offset = 0
+        return torch.from_numpy(np.multiply(crops, 1 / 32768, dtype=np.float32))
+
+
+def mix_at_snr(data: Tensor, noise: Tensor, snr_db: Tensor, mask: Tensor = None) -> Tensor:
+    """
+    Adds (batch, time) noise to (batch, time) data scaled to the given per record SNR.
+    Powers are measured over the valid positions of `mask`, padding stays zero.
+    """
+    if mask is not None:
+        noise = noise * mask
+        n_valid = mask.sum(dim=-1).clamp(min=1)
+    else:
+        n_valid = data.shape[-1]
+    signal_power = data.pow(2).sum(dim=-1) / n_valid
+    noise_power = (noise.pow(2).sum(dim=-1) / n_valid).clamp(min=1e-10)
+    scale = torch.sqrt(signal_power / (noise_power * 10 ** (snr_db / 10)))
+    return data + scale[:, None] * noise
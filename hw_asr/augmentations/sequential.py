@@ -1,8 +1,8 @@
-from typing import List, Callable
+from typing import List, Callable, Tuple
 
 from torch import Tensor
 
-from hw_asr.augmentations.base import AugmentationBase
+from hw_asr.augmentations.base import AugmentationBase, BatchAugmentationBase
 
 
 class SequentialAugmentation(AugmentationBase):
@@ -14,3 +14,14 @@ class SequentialAugmentation(AugmentationBase):
         for augmentation in self.augmentation_list:
             x = augmentation(data)
         return x
+
+
+class BatchSequentialAugmentation(BatchAugmentationBase):
+    def __init__(self, augmentation_list: List[BatchAugmentationBase]):
+        self.augmentation_list = augmentation_list
+
+    def __call__(self, data: Tensor, lengths: Tensor) -> Tuple[Tensor, Tensor]:
+        x = data
+        for augmentation in self.augmentation_list:
+            x, lengths = augmentation(x, lengths)
+        return x, lengths
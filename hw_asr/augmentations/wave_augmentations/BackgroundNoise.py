@@ -0,0 +1,27 @@
+import torch
+from torch import Tensor
+
+from hw_asr.augmentations.base import AugmentationBase
+from hw_asr.augmentations.noise_bank import NoiseBank, mix_at_snr
+from hw_asr.augmentations.random_apply import RandomApply
+
+
+class BackgroundNoise(AugmentationBase):
+    """
+    Mixes a random crop of a noise corpus into audio at an SNR from [min_snr_db, max_snr_db].
+    The corpus is a memory mapped PCM blob, see NoiseBank.
+    """
+
+    def __init__(self, blob_path: str, prob: float, sr: int = 16000, noise_path: str = None,
+                 min_snr_db: float = 5.0, max_snr_db: float = 20.0, *args, **kwargs):
+        self.bank = NoiseBank(blob_path, sr, noise_path)
+        self.min_snr_db = min_snr_db
+        self.max_snr_db = max_snr_db
+        self.random_caller = RandomApply(self.func_call, prob)
+
+    def func_call(self, data: Tensor):
+        snr_db = torch.empty(data.shape[0]).uniform_(self.min_snr_db, self.max_snr_db)
+        return mix_at_snr(data, self.bank.crop(data.shape[0], data.shape[-1]), snr_db)
+
+    def __call__(self, data: Tensor, *args, **kwargs):
+        return self.random_caller(data)
@@ -1,11 +1,24 @@
-import torch_audiomentations
+from torch import Tensor
 
 from hw_asr.augmentations.base import AugmentationBase
+from hw_asr.augmentations.ir_bank import ImpulseResponseBank
+from hw_asr.augmentations.random_apply import RandomApply
 
 
 class ImpulseResponse(AugmentationBase):
-    def __init__(self, ir_path: str, prob: float, sr: int, *args, **kwargs):
-        self.impulse_response = torch_audiomentations.ApplyImpulseResponse(ir_paths=ir_path, p=prob, sample_rate=sr)
+    """
+    Convolves audio with a random impulse response from `ir_path` (a directory or a list of files).
+    Impulse responses are loaded once into an ImpulseResponseBank, see it for `cache_path`.
+    """
 
-    def __call__(self, data):
-        return self.impulse_response(data.reshape(1, 1, -1)).squeeze(0)
+    def __init__(self, ir_path: str, prob: float, sr: int, cache_path: str = None,
+                 compensate_for_propagation_delay: bool = False, *args, **kwargs):
+        self.bank = ImpulseResponseBank(ir_path, sr, cache_path)
+        self.compensate_for_propagation_delay = compensate_for_propagation_delay
+        self.random_caller = RandomApply(self.func_call, prob)
+
+    def func_call(self, data: Tensor):
+        return self.bank.convolve(data, self.bank.sample(data.shape[0]), self.compensate_for_propagation_delay)
+
+    def __call__(self, data: Tensor, *args, **kwargs):
+        return self.random_caller(data)
@@ -0,0 +1,37 @@
+import random
+from typing import List
+
+from torch import Tensor
+
+from hw_asr.augmentations.base import AugmentationBase
+from hw_asr.augmentations.random_apply import RandomApply
+from hw_asr.utils import get_resampler
+
+
+def get_speed_resampler(sr: int, rate: float, device: str = "cpu"):
+    # audio sampled at `sr * rate` and played at `sr` is `rate` times faster,
+    # resampling kernel is computed once per rate
+    return get_resampler(int(round(sr * rate)), sr, str(device))
+
+
+def speed_perturb(data: Tensor, sr: int, rate: float) -> Tensor:
+    if rate == 1.0:
+        return data
+    return get_speed_resampler(sr, rate)(data)
+
+
+class SpeedPerturb(AugmentationBase):
+    """
+    Changes speed (tempo and pitch) of audio by resampling, rate is chosen from `rates`
+    """
+
+    def __init__(self, rates: List[float], sr: int = 16000, prob: float = 1.0, *args, **kwargs):
+        self.rates = rates
+        self.sr = sr
+        self.random_caller = RandomApply(self.func_call, prob)
+
+    def func_call(self, data: Tensor):
+        return speed_perturb(data, self.sr, random.choice(self.rates))
+
+    def __call__(self, data: Tensor, *args, **kwargs):
+        return self.random_caller(data)
@@ -1,16 +1,32 @@
 import torch
-from librosa.effects import time_stretch
+import torchaudio
+from torch import Tensor
 
 from hw_asr.augmentations.base import AugmentationBase
 from hw_asr.augmentations.random_apply import RandomApply
 
 
 class StretchWrapper:
-    def __init__(self, rate: float, *args, **kwargs):
+    """
+    Phase vocoder time stretch: changes tempo of audio keeping its pitch.
+    Works on (..., time) waveforms, so a whole batch is stretched with one STFT.
+    """
+
+    def __init__(self, rate: float, n_fft: int = 512, *args, **kwargs):
         self.rate = rate
+        self.n_fft = n_fft
+        self.hop_length = n_fft // 4
+        self.window = torch.hann_window(n_fft)
+        self.stretch = torchaudio.transforms.TimeStretch(
+            hop_length=self.hop_length, n_freq=n_fft // 2 + 1, fixed_rate=rate
+        )
 
-    def __call__(self, data):
-        return time_stretch(data, rate=self.rate)
+    def __call__(self, data: Tensor):
+        spec = torch.stft(data, self.n_fft, self.hop_length, window=self.window, return_complex=True)
+        return torch.istft(
+            self.stretch(spec), self.n_fft, self.hop_length, window=self.window,
+            length=int(round(data.shape[-1] / self.rate))
+        )
 
 
 class TimeStretch(AugmentationBase):
@@ -19,4 +35,4 @@ class TimeStretch(AugmentationBase):
         self.random_caller = RandomApply(StretchWrapper(*args, **kwargs), self.prob)
 
     def __call__(self, data, *args, **kwargs):
-        return torch.from_numpy(self.random_caller(data.numpy().squeeze()))
+        return self.random_caller(data)
@@ -1,10 +1,15 @@
+from hw_asr.augmentations.wave_augmentations.BackgroundNoise import BackgroundNoise
 from hw_asr.augmentations.wave_augmentations.Gain import Gain
 from hw_asr.augmentations.wave_augmentations.ImpulseResponse import ImpulseResponse
 from hw_asr.augmentations.wave_augmentations.Noise import GaussianNoise
+from hw_asr.augmentations.wave_augmentations.SpeedPerturb import SpeedPerturb
 from hw_asr.augmentations.wave_augmentations.TimeStretch import TimeStretch
 
 __all__ = [
+    "BackgroundNoise",
     "Gain",
     "ImpulseResponse",
-    "GaussianNoise"
+    "GaussianNoise",
+    "SpeedPerturb",
+    "TimeStretch"
 ]
@@ -7,7 +7,11 @@ import torchaudio
 from torch import Tensor
 from torch.utils.data import Dataset
 
+from hw_asr.augmentations.wave_augmentations.SpeedPerturb import speed_perturb
 from hw_asr.base.base_text_encoder import BaseTextEncoder
+from hw_asr.storage.columnar_index import ColumnarIndex
+from hw_asr.storage.feature_cache import FeatureCache
+from hw_asr.utils import get_resampler
 from hw_asr.utils.parse_config import ConfigParser
 
 logger = logging.getLogger(__name__)
@@ -24,87 +28,195 @@ class BaseDataset(Dataset):
         limit=None,
         max_audio_length=None,
         max_text_length=None,
+        feature_cache_dir=None,
+        feature_cache_speeds=None,
+        fields=None,
     ):
-        self.text_encoder = text_encoder
-        self.config_parser = config_parser
-        self.wave_augs = wave_augs
-        self.spec_augs = spec_augs
+        self._init_processing(text_encoder, config_parser, wave_augs, spec_augs, fields)
 
-        for entry in index:
-            assert "audio_len" in entry, (
-                "Each dataset item should include field 'audio_len'"
-                " - duration of audio (in seconds)."
-            )
-            assert "path" in entry, (
-                "Each dataset item should include field 'path'" " - path to audio file."
-            )
-            assert "text" in entry, (
-                "Each dataset item should include field 'text'"
-                " - text transcription of the audio."
-            )
+        if not isinstance(index, ColumnarIndex):
+            index = ColumnarIndex.from_records(index)
+        assert "audio_len" in index, (
+            "Each dataset item should include field 'audio_len'"
+            " - duration of audio (in seconds)."
+        )
+        assert "path" in index, (
+            "Each dataset item should include field 'path'" " - path to audio file."
+        )
+        assert "text" in index, (
+            "Each dataset item should include field 'text'"
+            " - text transcription of the audio."
+        )
+
+        if feature_cache_dir is not None:
+            for speed in feature_cache_speeds or [1.0]:
+                self.feature_caches[speed] = FeatureCache(
+                    feature_cache_dir, index, config_parser["preprocessing"], self._get_wave2spec(), speed
+                )
+            # cache slots are positions in the index before filtering and sorting
+            index.add_column("cache_slot", np.arange(len(index)))
+        # transcripts are normalized and encoded once, items get views into the packed array
+        index.add_ragged_column("text_encoded", *text_encoder.encode_packed(*index.strings["text"]))
 
         index = self._filter_records_from_dataset(
             index, max_audio_length, max_text_length, limit
         )
 
+        speeds = sorted(self.feature_caches)
+        if len(speeds) > 1 and (wave_augs is not None or self.batch_frontend):
+            logger.warning(
+                f"feature_cache_speeds {speeds} are ignored, audio with wave augmentations "
+                "or a batch frontend is processed without the feature cache"
+            )
+        elif len(speeds) > 1:
+            index = self._expand_speeds(index, speeds)
+
         # it's a good idea to sort index by audio length
         # It would be easier to write length-based batch samplers later
         index = self._sort_index(index)
         self._index = index
-        self.data_ids = list(range(len(self._index)))
+        self.data_ids = np.arange(len(self._index))
+
+    def _init_processing(self, text_encoder, config_parser, wave_augs, spec_augs, fields):
+        """
+        State needed to turn index records into items, without the index itself
+        """
+        self.text_encoder = text_encoder
+        self.config_parser = config_parser
+        self.wave_augs = wave_augs
+        self.spec_augs = spec_augs
+        # spectrograms are computed for the whole batch by hw_asr.frontend.LogMelFrontend
+        self.batch_frontend = config_parser["preprocessing"].get("batch_frontend", False)
+        self._wave2spec = None
+        # item fields to return, all of them by default
+        self.fields = fields
+        # speed perturbation rate -> cache of features of perturbed audio
+        self.feature_caches = {}
 
     def __getitem__(self, ind):
-        data_dict = self._index[ind]
+        return self.make_item(self._index[ind])
+
+    def make_item(self, data_dict: dict) -> dict:
         audio_path = data_dict["path"]
-        audio_wave = self.load_audio(audio_path)
-        audio_wave, audio_spec = self.process_wave(audio_wave)
-        return {
+        audio_wave, audio_spec = self.load_and_process(data_dict)
+        return self.project({
             "audio": audio_wave,
-            "frames": len(audio_wave),
+            "frames": int(data_dict["audio_len"] * self.config_parser["preprocessing"]["sr"]),
             "spectrogram": audio_spec,
             "duration": data_dict["audio_len"],
             "text": data_dict["text"],
-            "text_encoded": self.text_encoder.encode(data_dict["text"]),
+            "text_encoded": torch.from_numpy(data_dict["text_encoded"]).unsqueeze(0),
             "audio_path": audio_path,
-        }
+        })
 
     @staticmethod
-    def _sort_index(index):
-        return sorted(index, key=lambda x: x["audio_len"])
+    def _expand_speeds(index: ColumnarIndex, speeds) -> ColumnarIndex:
+        """
+        One row per (record, speed), like copies of a corpus perturbed by every speed.
+        Rows keep the cache slot of their record, durations are those of the perturbed audio.
+        """
+        n_records = len(index)
+        index = index.take(np.tile(np.arange(n_records), len(speeds)))
+        index.add_column("speed", np.repeat(np.asarray(speeds, dtype=np.float64), n_records))
+        index.add_column("audio_len", index.column("audio_len") / index.column("speed"))
+        return index
+
+    def project(self, item: dict) -> dict:
+        """
+        Keeps only `fields` of an item, e.g. the ones the collate function consumes
+        """
+        if self.fields is None:
+            return item
+        return {key: item[key] for key in self.fields}
+
+    @staticmethod
+    def _sort_index(index: ColumnarIndex) -> ColumnarIndex:
+        return index.take(np.argsort(index.column("audio_len"), kind="stable"))
 
     def __len__(self):
         return len(self._index)
 
+    def get_lengths(self) -> np.ndarray:
+        """
+        Lengths of records in audio frames at the target sample rate, same as item["frames"].
+        Taken from the index, so no audio is loaded.
+        """
+        audio_len = self._index.column("audio_len").astype(np.float64)
+        return (audio_len * self.config_parser["preprocessing"]["sr"]).astype(np.int64)
+
+    @staticmethod
+    def _speed(data_dict) -> float:
+        return float(data_dict["speed"]) if "speed" in data_dict else 1.0
+
     def load_audio(self, path):
         audio_tensor, sr = torchaudio.load(path)
         audio_tensor = audio_tensor[0:1, :]  # remove all channels but the first
         target_sr = self.config_parser["preprocessing"]["sr"]
         if sr != target_sr:
-            audio_tensor = torchaudio.functional.resample(audio_tensor, sr, target_sr)
+            audio_tensor = get_resampler(sr, target_sr)(audio_tensor)
         return audio_tensor
 
-    def process_wave(self, audio_tensor_wave: Tensor):
-        with torch.no_grad():
-            if self.wave_augs is not None:
-                audio_tensor_wave = self.wave_augs(audio_tensor_wave)
-            wave2spec = self.config_parser.init_obj(
+    def _get_wave2spec(self):
+        if self._wave2spec is None:
+            self._wave2spec = self.config_parser.init_obj(
                 self.config_parser["preprocessing"]["spectrogram"],
                 torchaudio.transforms,
             )
+        return self._wave2spec
+
+    def load_entry_audio(self, data_dict):
+        return self.load_audio(data_dict["path"])
+
+    def load_and_process(self, data_dict):
+        """
+        Returns waveform and log-spectrogram of the record.
+        Without wave augmentations spectrogram is taken from the feature cache,
+        the waveform isn't even loaded then (None is returned instead).
+        With several `feature_cache_speeds` every record is in the index once per speed
+        and the row is perturbed by its speed.
+        With `batch_frontend` only the (augmented) waveform is returned.
+        """
+        if self.batch_frontend:
+            audio_tensor_wave = self.load_entry_audio(data_dict)
+            if self.wave_augs is not None:
+                with torch.no_grad():
+                    audio_tensor_wave = self.wave_augs(audio_tensor_wave)
+            return audio_tensor_wave, None
+
+        if len(self.feature_caches) == 0 or self.wave_augs is not None:
+            return self.process_wave(self.load_entry_audio(data_dict))
+        cache_slot = data_dict["cache_slot"]
+        speed = self._speed(data_dict)
+        audio_tensor_spec = self.feature_caches[speed].get(cache_slot)
+        if audio_tensor_spec is None:
+            audio_tensor_wave = speed_perturb(
+                self.load_entry_audio(data_dict), self.config_parser["preprocessing"]["sr"], speed
+            )
+            return self.process_wave(audio_tensor_wave, cache_slot=cache_slot, speed=speed)
+        if self.spec_augs is not None:
+            audio_tensor_spec = self.spec_augs(audio_tensor_spec)
+        return None, audio_tensor_spec
+
+    def process_wave(self, audio_tensor_wave: Tensor, cache_slot=None, speed=1.0):
+        with torch.no_grad():
+            if self.wave_augs is not None:
+                audio_tensor_wave = self.wave_augs(audio_tensor_wave)
+            wave2spec = self._get_wave2spec()
             audio_tensor_spec = wave2spec(audio_tensor_wave).clamp(1e-5).log()
+            if cache_slot is not None and speed in self.feature_caches and self.wave_augs is None:
+                # fill the cache lazily, spec augmentations are applied on top of cached features
+                self.feature_caches[speed].put(cache_slot, audio_tensor_spec)
             if self.spec_augs is not None:
                 audio_tensor_spec = self.spec_augs(audio_tensor_spec)
             return audio_tensor_wave, audio_tensor_spec
 
     @staticmethod
     def _filter_records_from_dataset(
-        index: list, max_audio_length, max_text_length, limit
-    ) -> list:
+        index: ColumnarIndex, max_audio_length, max_text_length, limit
+    ) -> ColumnarIndex:
         initial_size = len(index)
         if max_audio_length is not None:
-            exceeds_audio_length = (
-                np.array([el["audio_len"] for el in index]) >= max_audio_length
-            )
+            exceeds_audio_length = index.column("audio_len") >= max_audio_length
             _total = exceeds_audio_length.sum()
             logger.info(
                 f"{_total} ({_total / initial_size:.1%}) records are longer then "
@@ -115,12 +227,8 @@ class BaseDataset(Dataset):
 
         initial_size = len(index)
         if max_text_length is not None:
-            exceeds_text_length = (
-                np.array(
-                    [len(BaseTextEncoder.normalize_text(el["text"])) for el in index]
-                )
-                >= max_text_length
-            )
+            text_offsets, _ = index.ragged["text_encoded"]
+            exceeds_text_length = np.diff(text_offsets) >= max_text_length
             _total = exceeds_text_length.sum()
             logger.info(
                 f"{_total} ({_total / initial_size:.1%}) records are longer then "
@@ -133,13 +241,15 @@ class BaseDataset(Dataset):
 
         if records_to_filter is not False and records_to_filter.any():
             _total = records_to_filter.sum()
-            index = [el for el, exclude in zip(index, records_to_filter) if not exclude]
+            index = index.take(np.flatnonzero(~records_to_filter))
             logger.info(
                 f"Filtered {_total}({_total / initial_size:.1%}) records  from dataset"
             )
 
         if limit is not None:
             random.seed(42)  # best seed for deep learning
-            random.shuffle(index)
-            index = index[:limit]
+            # same permutation as shuffling the records themselves
+            order = list(range(len(index)))
+            random.shuffle(order)
+            index = index.take(order[:limit])
         return index
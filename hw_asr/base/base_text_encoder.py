@@ -1,14 +1,32 @@
 import re
-from typing import List, Union
+from typing import List, Tuple, Union
 
 import numpy as np
 from torch import Tensor
 
+# bytes of an utf-8 text which survive `normalize_text`: latin letters and space
+NORMALIZED_BYTES = np.zeros(256, dtype=bool)
+NORMALIZED_BYTES[[ord(c) for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ "]] = True
+
 
 class BaseTextEncoder:
     def encode(self, text) -> Tensor:
         raise NotImplementedError
 
+    def encode_packed(self, offsets: np.ndarray, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encodes utf-8 texts packed into one byte array with offsets.
+        Returns offsets and the packed int8 token indices.
+        """
+        assert len(self) <= 128, "Token indices are stored as int8"
+        encoded = [
+            np.asarray(self.encode(data[start: end].tobytes().decode("utf-8"))).reshape(-1).astype(np.int8)
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        new_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=new_offsets[1:])
+        return new_offsets, np.concatenate(encoded + [np.zeros(0, dtype=np.int8)])
+
     def decode(self, vector: Union[Tensor, np.ndarray, List[int]]):
         raise NotImplementedError
 
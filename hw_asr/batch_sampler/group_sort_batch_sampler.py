@@ -1,14 +1,76 @@
+import logging
+import random
+from typing import List
+
+import numpy as np
 from torch.utils.data import Sampler
 
+logger = logging.getLogger(__name__)
+
+
+def group_by_length(lengths: np.ndarray, batch_size=None, max_frames=None, drop_last=False) -> List[List[int]]:
+    """
+    Splits records into batches of similar lengths.
+
+    Records are taken in order of increasing length and added to a batch while it holds
+    at most `batch_size` records and its padded size (records * longest record) stays
+    within `max_frames` audio frames.
+    """
+    # dataset index is already sorted by length, stable sort keeps that order
+    order = np.argsort(lengths, kind="stable")
+    batches = []
+    batch = []
+    for ind in order.tolist():
+        new_size = len(batch) + 1
+        if len(batch) > 0 and (
+                (batch_size is not None and new_size > batch_size)
+                or (max_frames is not None and new_size * lengths[ind] > max_frames)
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(ind)
+    if len(batch) > 0 and not (drop_last and batch_size is not None and len(batch) < batch_size):
+        batches.append(batch)
+    return batches
+
 
 class GroupLengthBatchSampler(Sampler):
-    def __init__(self, data_source, batch_size, batches_per_group=20):
-        super().__init__(data_source)
-        # TODO: your code here (optional)
-        raise NotImplementedError
+    """
+    Forms batches of records with similar lengths, see `group_by_length`.
+    Every epoch batches are shuffled inside groups of
+    `batches_per_group` neighbouring batches and the groups themselves are shuffled.
+    """
+
+    def __init__(self, dataset, batch_size=None, max_frames=None, batches_per_group=20,
+                 lengths_list=None, shuffle=True, drop_last=False):
+        super().__init__(dataset)
+        assert batch_size is not None or max_frames is not None, \
+            "You must provide batch_size or max_frames for GroupLengthBatchSampler"
+        if lengths_list is None:
+            lengths_list = dataset.get_lengths()
+        lengths = np.asarray(lengths_list, dtype=np.int64)
+        self.batches_per_group = batches_per_group
+        self.shuffle = shuffle
+
+        self.batches = group_by_length(lengths, batch_size, max_frames, drop_last)
+
+        padded_frames = sum(len(b) * lengths[b[-1]] for b in self.batches)
+        self.padding_efficiency = sum(lengths[b].sum() for b in self.batches) / max(padded_frames, 1)
+        logger.info(
+            f"Grouped {len(lengths)} records into {len(self.batches)} batches, "
+            f"padding efficiency: {self.padding_efficiency:.1%}"
+        )
 
     def __iter__(self):
-        raise NotImplementedError
+        groups = [
+            self.batches[i: i + self.batches_per_group]
+            for i in range(0, len(self.batches), self.batches_per_group)
+        ]
+        if self.shuffle:
+            groups = [random.sample(group, len(group)) for group in groups]
+            random.shuffle(groups)
+        for group in groups:
+            yield from group
 
     def __len__(self):
-        raise NotImplementedError
+        return len(self.batches)
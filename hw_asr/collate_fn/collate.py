@@ -1,40 +1,86 @@
 import logging
-from typing import List
+from typing import Dict, List, Optional, Sequence
 
 import torch
-from torch.nn.utils.rnn import pad_sequence
+from torch import Tensor
+from torch.utils.data import get_worker_info
 
 logger = logging.getLogger(__name__)
 
+# item fields consumed by collate_fn, datasets of a DataLoader produce only these
+COLLATED_FIELDS = ("spectrogram", "text", "text_encoded")
 
-def collate_fn(dataset_items: List[dict]):
+
+def collated_fields(batch_frontend: bool = False) -> List[str]:
+    # with the batch frontend spectrograms are computed later from the collated audio
+    return list(COLLATED_FIELDS) + (["audio"] if batch_frontend else [])
+
+
+def _new_batch_tensor(shape, dtype, pin_memory: bool = False) -> Tensor:
+    """
+    Zero tensor for a batch. In a DataLoader worker it is allocated in shared memory right away,
+    so sending the batch to the main process doesn't copy it into shared memory once more.
+    In the main process it can be allocated in pinned memory instead.
+    """
+    if get_worker_info() is None:
+        pin_memory = pin_memory and torch.cuda.is_available()
+        return torch.empty(shape, dtype=dtype, pin_memory=pin_memory).zero_()
+    return torch.empty(shape, dtype=dtype).share_memory_().zero_()
+
+
+def _pad(sequences: Sequence[Tensor], lengths: List[int], multiple: int = 1, dtype=None,
+         pin_memory: bool = False) -> Tensor:
+    """
+    Pads (time, ...) tensors into a (batch, padded_time, ...) batch buffer,
+    padded_time is max length rounded up to `multiple`
+    """
+    padded_length = -(-max(lengths) // multiple) * multiple
+    dtype = dtype if dtype is not None else sequences[0].dtype
+    batch = _new_batch_tensor((len(sequences), padded_length, *sequences[0].shape[1:]), dtype, pin_memory)
+    for i, seq in enumerate(sequences):
+        batch[i, :lengths[i]] = seq
+    return batch
+
+
+def collate_fn(dataset_items: List[dict], pad_to_multiple: Optional[Dict[str, int]] = None,
+               pin_memory: bool = False):
     """
     Collate and pad fields in dataset items
+
+    :param pad_to_multiple: field ("spectrogram", "audio", "text_encoded") -> multiple its padded time
+        dimension is rounded up to. A few stable shapes are friendlier to cudnn autotuning and allocator.
+    :param pin_memory: allocate batch tensors in pinned memory when collating in the main process
     """
+    pad_to_multiple = pad_to_multiple if pad_to_multiple is not None else {}
 
     result_batch = {}
     spectrograms = []
-    spectrograms_length = []
+    audios = []
     texts = []
     texts_encoded = []
-    texts_encoded_length = []
     # iterate over items
     for item in dataset_items:
-        squeezed_spectrogram = item["spectrogram"].squeeze(0).T
-        spectrograms.append(squeezed_spectrogram)
-        spectrograms_length.append(squeezed_spectrogram.shape[0])
+        if item["spectrogram"] is not None:
+            spectrograms.append(item["spectrogram"].squeeze(0).T)
+        else:
+            # batch frontend mode: spectrograms are computed later for the whole batch
+            audios.append(item["audio"].squeeze(0))
 
         texts.append(item["text"])
-
-        squeezed_text_encoded = item["text_encoded"].squeeze(0)
-        texts_encoded.append(squeezed_text_encoded)
-        texts_encoded_length.append(len(squeezed_text_encoded))
+        texts_encoded.append(item["text_encoded"].squeeze(0))
 
     # form batch
-    result_batch["spectrogram"] = pad_sequence(spectrograms, batch_first=True)
-    result_batch["text_encoded"] = pad_sequence(texts_encoded, batch_first=True)
-    result_batch["text_encoded_length"] = torch.Tensor(texts_encoded_length).int()
-    result_batch["spectrogram_length"] = torch.Tensor(spectrograms_length).int()
+    for key, sequences in [("spectrogram", spectrograms), ("audio", audios), ("text_encoded", texts_encoded)]:
+        if len(sequences) == 0:
+            continue
+        lengths = [len(seq) for seq in sequences]
+        # texts are stored as int8 token indices, CTC loss wants integer targets
+        dtype = torch.int32 if key == "text_encoded" else None
+        result_batch[key] = _pad(sequences, lengths, pad_to_multiple.get(key, 1), dtype, pin_memory)
+        result_batch[f"{key}_length"] = _new_batch_tensor((len(lengths),), torch.int32, pin_memory)
+        result_batch[f"{key}_length"][:] = torch.tensor(lengths, dtype=torch.int32)
     result_batch["text"] = texts
+    if "audio_path" in dataset_items[0]:
+        result_batch["audio_path"] = [item["audio_path"] for item in dataset_items]
 
     return result_batch
@@ -1,9 +1,13 @@
 from hw_asr.datasets.custom_audio_dataset import CustomAudioDataset
 from hw_asr.datasets.custom_dir_audio_dataset import CustomDirAudioDataset
 from hw_asr.datasets.librispeech_dataset import LibrispeechDataset
+from hw_asr.datasets.packed_audio_dataset import PackedAudioDataset
+from hw_asr.datasets.streaming_shard_dataset import StreamingShardDataset
 
 __all__ = [
     "LibrispeechDataset",
     "CustomDirAudioDataset",
-    "CustomAudioDataset"
+    "CustomAudioDataset",
+    "PackedAudioDataset",
+    "StreamingShardDataset"
 ]
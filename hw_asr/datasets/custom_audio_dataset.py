@@ -1,6 +1,10 @@
+import json
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import torch
 import torchaudio
 
 from hw_asr.base.base_dataset import BaseDataset
@@ -10,32 +14,84 @@ from hw_asr.utils.parse_config import ConfigParser
 logger = logging.getLogger(__name__)
 
 
+def _probe_audio_len(path):
+    t_info = torchaudio.info(path)
+    return t_info.num_frames / t_info.sample_rate
+
+
 class CustomAudioDataset(BaseDataset):
-    def __init__(self, data, *args, **kwargs):
+    def __init__(self, data, index_cache_path=None, probe_workers=None, *args, **kwargs):
+        """
+        :param index_cache_path: json sidecar with metadata of probed files, entries are keyed by
+            path and reused while size and mtime of the file stay the same.
+        :param probe_workers: number of threads probing new files (default: ThreadPoolExecutor default).
+        """
         index = data
+        known_entries = self._load_index_cache(index_cache_path)
+        to_probe = []
         for entry in data:
             assert "path" in entry
             assert Path(entry["path"]).exists()
             entry["path"] = str(Path(entry["path"]).absolute().resolve())
             entry["text"] = entry.get("text", "")
-            t_info = torchaudio.info(entry["path"])
-            entry["audio_len"] = t_info.num_frames / t_info.sample_rate
+            stat = os.stat(entry["path"])
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+            known = known_entries.get(entry["path"])
+            if known is not None and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                entry["audio_len"] = known["audio_len"]
+            else:
+                to_probe.append(entry)
+
+        if len(to_probe) > 0:
+            # torchaudio.info is mostly file IO, threads are enough to overlap it
+            with ThreadPoolExecutor(max_workers=probe_workers) as executor:
+                lengths = executor.map(_probe_audio_len, [entry["path"] for entry in to_probe])
+                for entry, audio_len in zip(to_probe, lengths):
+                    entry["audio_len"] = audio_len
+            logger.info(f"Probed {len(to_probe)} of {len(data)} audio files")
+            if index_cache_path is not None:
+                for entry in to_probe:
+                    known_entries[entry["path"]] = {
+                        key: entry[key] for key in ["size", "mtime", "audio_len"]
+                    }
+                self._save_index_cache(index_cache_path, known_entries)
 
         super().__init__(index, *args, **kwargs)
 
+    @staticmethod
+    def _load_index_cache(index_cache_path) -> dict:
+        if index_cache_path is None or not Path(index_cache_path).exists():
+            return {}
+        with Path(index_cache_path).open() as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_index_cache(index_cache_path, entries: dict):
+        index_cache_path = Path(index_cache_path)
+        tmp_path = index_cache_path.with_name(index_cache_path.name + ".tmp")
+        # files deleted since they were probed
+        entries = {path: entry for path, entry in entries.items() if Path(path).exists()}
+        try:
+            index_cache_path.parent.mkdir(exist_ok=True, parents=True)
+            with tmp_path.open("w") as f:
+                json.dump(entries, f)
+            # atomic replace, concurrent readers never see a partially written cache
+            os.replace(tmp_path, index_cache_path)
+        except OSError as e:
+            logger.warning(f"Can't save index cache {index_cache_path}: {e}")
+
     def __getitem__(self, ind):
         data_dict = self._index[ind]
         wav_path = data_dict["path"]
-        audio_wave = self.load_audio(wav_path)
-        audio_wave, audio_spec = self.process_wave(audio_wave)
-        return {
+        audio_wave, audio_spec = self.load_and_process(data_dict)
+        return self.project({
             "audio": audio_wave,
             "spectrogram": audio_spec,
             "duration": data_dict["audio_len"],
             "text": data_dict["text"],
-            "text_encoded": self.text_encoder.encode(data_dict["text"]),
+            "text_encoded": torch.from_numpy(data_dict["text_encoded"]).unsqueeze(0),
             "audio_path": wav_path,
-        }
+        })
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
+import hashlib
 import logging
+import os
 from pathlib import Path
 
 from hw_asr.datasets.custom_audio_dataset import CustomAudioDataset
@@ -7,13 +9,29 @@ from hw_asr.utils.parse_config import ConfigParser
 
 logger = logging.getLogger(__name__)
 
+AUDIO_SUFFIXES = [".mp3", ".wav", ".flac", ".m4a"]
+
+
+def default_index_cache_path(audio_dir) -> Path:
+    """
+    Index cache of a directory in the user cache dir: `$XDG_CACHE_HOME/hw_asr/index_cache/<hash of audio_dir>.json`
+    (`~/.cache` without XDG_CACHE_HOME). The directory is created when the cache is saved.
+    """
+    dir_hash = hashlib.sha1(str(Path(audio_dir).absolute().resolve()).encode()).hexdigest()[:16]
+    cache_root = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return cache_root / "hw_asr" / "index_cache" / f"{dir_hash}.json"
+
 
 class CustomDirAudioDataset(CustomAudioDataset):
     def __init__(self, audio_dir, transcription_dir=None, *args, **kwargs):
+        """
+        Metadata of probed files is cached only if `index_cache_path` is given,
+        see `default_index_cache_path` for a per directory location.
+        """
         data = []
         for path in Path(audio_dir).iterdir():
             entry = {}
-            if path.suffix in [".mp3", ".wav", ".flac", ".m4a"]:
+            if path.suffix in AUDIO_SUFFIXES:
                 entry["path"] = str(path)
                 if transcription_dir and Path(transcription_dir).exists():
                     transc_path = Path(transcription_dir) / (path.stem + '.txt')
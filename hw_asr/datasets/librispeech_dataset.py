@@ -2,6 +2,8 @@ import json
 import logging
 import os
 import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import torchaudio
@@ -9,6 +11,7 @@ from speechbrain.utils.data_utils import download_file
 from tqdm import tqdm
 
 from hw_asr.base.base_dataset import BaseDataset
+from hw_asr.storage.columnar_index import ColumnarIndex
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
 from hw_asr.utils import ROOT_PATH
 from hw_asr.utils.parse_config import ConfigParser
@@ -26,20 +29,63 @@ URL_LINKS = {
 }
 
 
+def _index_flac_dir(flac_dir, known_entries):
+    """
+    Indexes one speaker/chapter directory. Files with the same size and mtime as
+    in `known_entries` (path -> previous index entry) are not probed again.
+    """
+    flac_dir = Path(flac_dir)
+    index = []
+    n_probed = 0
+    trans_path = list(flac_dir.glob("*.trans.txt"))[0]
+    with trans_path.open() as f:
+        for line in f:
+            f_id = line.split()[0]
+            f_text = " ".join(line.split()[1:]).strip()
+            flac_path = str((flac_dir / f"{f_id}.flac").absolute().resolve())
+            stat = os.stat(flac_path)
+            entry = known_entries.get(flac_path)
+            if entry is not None and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                length = entry["audio_len"]
+            else:
+                t_info = torchaudio.info(flac_path)
+                length = t_info.num_frames / t_info.sample_rate
+                n_probed += 1
+            index.append(
+                {
+                    "path": flac_path,
+                    "text": f_text.lower(),
+                    "audio_len": length,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                }
+            )
+    return index, n_probed
+
+
 class LibrispeechDataset(BaseDataset):
-    def __init__(self, part, data_dir=None, *args, **kwargs):
+    def __init__(self, part, data_dir=None, feature_cache=False, index_workers=None, rebuild_index=False,
+                 *args, **kwargs):
+        """
+        :param index_workers: number of processes used to build the index (default: number of CPUs).
+        :param rebuild_index: rebuild an existing index, only new and changed files are probed.
+        """
         assert part in URL_LINKS or part == 'train_all'
 
         if data_dir is None:
             data_dir = ROOT_PATH / "data" / "datasets" / "librispeech"
             data_dir.mkdir(exist_ok=True, parents=True)
         self._data_dir = Path(data_dir)
+        self._index_workers = index_workers if index_workers is not None else os.cpu_count()
+        self._rebuild_index = rebuild_index
         if part == 'train_all':
-            index = sum([self._get_or_load_index(part)
-                         for part in URL_LINKS if 'train' in part], [])
+            index = ColumnarIndex.concat([self._get_or_load_index(part)
+                                          for part in URL_LINKS if 'train' in part])
         else:
             index = self._get_or_load_index(part)
 
+        if feature_cache:
+            kwargs["feature_cache_dir"] = self._data_dir / "features" / part
         super().__init__(index, *args, **kwargs)
 
     def _load_part(self, part):
@@ -52,46 +98,56 @@ class LibrispeechDataset(BaseDataset):
         os.remove(str(arch_path))
         shutil.rmtree(str(self._data_dir / "LibriSpeech"))
 
-    def _get_or_load_index(self, part):
+    def _get_or_load_index(self, part) -> ColumnarIndex:
+        # json index is the source of truth, columnar copy next to it is what is loaded normally
         index_path = self._data_dir / f"{part}_index.json"
+        columnar_index_path = self._data_dir / f"{part}_index.npz"
+        if not self._rebuild_index and index_path.exists():
+            if columnar_index_path.exists() and \
+                    columnar_index_path.stat().st_mtime >= index_path.stat().st_mtime:
+                return ColumnarIndex.load(columnar_index_path)
+            with index_path.open() as f:
+                index = ColumnarIndex.from_records(json.load(f))
+            index.save(columnar_index_path)
+            return index
+
+        previous_index = []
         if index_path.exists():
             with index_path.open() as f:
-                index = json.load(f)
-        else:
-            index = self._create_index(part)
-            with index_path.open("w") as f:
-                json.dump(index, f, indent=2)
+                previous_index = json.load(f)
+        index = self._create_index(part, previous_index)
+        with index_path.open("w") as f:
+            json.dump(index, f, indent=2)
+        index = ColumnarIndex.from_records(index)
+        index.save(columnar_index_path)
         return index
 
-    def _create_index(self, part):
-        index = []
+    def _create_index(self, part, previous_index=()):
         split_dir = self._data_dir / part
         if not split_dir.exists():
             self._load_part(part)
 
-        flac_dirs = set()
+        flac_dirs = []
         for dirpath, dirnames, filenames in os.walk(str(split_dir)):
             if any([f.endswith(".flac") for f in filenames]):
-                flac_dirs.add(dirpath)
-        for flac_dir in tqdm(
-                list(flac_dirs), desc=f"Preparing librispeech folders: {part}"
-        ):
-            flac_dir = Path(flac_dir)
-            trans_path = list(flac_dir.glob("*.trans.txt"))[0]
-            with trans_path.open() as f:
-                for line in f:
-                    f_id = line.split()[0]
-                    f_text = " ".join(line.split()[1:]).strip()
-                    flac_path = flac_dir / f"{f_id}.flac"
-                    t_info = torchaudio.info(str(flac_path))
-                    length = t_info.num_frames / t_info.sample_rate
-                    index.append(
-                        {
-                            "path": str(flac_path.absolute().resolve()),
-                            "text": f_text.lower(),
-                            "audio_len": length,
-                        }
-                    )
+                flac_dirs.append(str(Path(dirpath).absolute().resolve()))
+        flac_dirs = sorted(flac_dirs)
+
+        known_entries = defaultdict(dict)
+        for entry in previous_index:
+            known_entries[str(Path(entry["path"]).parent)][entry["path"]] = entry
+        tasks = [(flac_dir, known_entries[flac_dir]) for flac_dir in flac_dirs]
+
+        index = []
+        n_probed = 0
+        with ProcessPoolExecutor(max_workers=self._index_workers) as executor:
+            results = executor.map(_index_flac_dir, *zip(*tasks)) if tasks else []
+            for dir_index, dir_probed in tqdm(
+                    results, total=len(tasks), desc=f"Preparing librispeech folders: {part}"
+            ):
+                index.extend(dir_index)
+                n_probed += dir_probed
+        logger.info(f"Indexed {len(index)} files of {part}, {n_probed} of them were probed")
         return index
 
 
@@ -0,0 +1,60 @@
+import logging
+
+import numpy as np
+import torch
+
+from hw_asr.base.base_dataset import BaseDataset
+from hw_asr.storage.audio_shards import load_shards_index, shard_path
+from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+from hw_asr.utils.parse_config import ConfigParser
+
+logger = logging.getLogger(__name__)
+
+
+class PackedAudioDataset(BaseDataset):
+    """
+    Dataset over int16 PCM shards written by `hw_asr.storage.audio_shards.pack_dataset`.
+    Audio is already decoded and resampled, samples are read straight from memory-mapped shards.
+    """
+
+    def __init__(self, shards_dir, *args, **kwargs):
+        self._shards_dir = shards_dir
+        self._shards = {}
+        sr, index = load_shards_index(shards_dir)
+        super().__init__(index, *args, **kwargs)
+        assert sr == self.config_parser["preprocessing"]["sr"], \
+            f"Shards in {shards_dir} are sampled at {sr}Hz, repack them for the current preprocessing"
+
+    def _get_shard(self, shard):
+        # memmaps are opened lazily, so that every DataLoader worker maps the shards by itself
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(str(shard_path(self._shards_dir, shard)), dtype=np.int16, mode="r")
+        return self._shards[shard]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    def load_entry_audio(self, data_dict):
+        offset = data_dict["offset"]
+        samples = self._get_shard(data_dict["shard"])[offset: offset + data_dict["length"]]
+        return torch.from_numpy(np.multiply(samples, 1 / 32768, dtype=np.float32)).unsqueeze(0)
+
+
+if __name__ == "__main__":
+    from hw_asr.datasets.librispeech_dataset import LibrispeechDataset
+    from hw_asr.storage.audio_shards import pack_dataset
+    from hw_asr.utils import ROOT_PATH
+
+    text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+    config_parser = ConfigParser.get_default_configs()
+
+    shards_dir = ROOT_PATH / "data" / "datasets" / "librispeech" / "packed" / "dev-clean"
+    pack_dataset(
+        LibrispeechDataset("dev-clean", text_encoder=text_encoder, config_parser=config_parser),
+        shards_dir
+    )
+    ds = PackedAudioDataset(shards_dir, text_encoder=text_encoder, config_parser=config_parser)
+    item = ds[0]
+    print(item)
@@ -0,0 +1,131 @@
+import logging
+import math
+import random
+
+import numpy as np
+from torch.utils.data import IterableDataset, get_worker_info
+
+from hw_asr.base.base_text_encoder import BaseTextEncoder
+from hw_asr.batch_sampler.group_sort_batch_sampler import group_by_length
+from hw_asr.datasets.packed_audio_dataset import PackedAudioDataset
+from hw_asr.storage.audio_shards import load_shard_index, load_shards_manifest
+from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+from hw_asr.utils.parse_config import ConfigParser
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingShardDataset(PackedAudioDataset, IterableDataset):
+    """
+    Iterable version of PackedAudioDataset for corpora too large for random access.
+
+    The corpus index is never loaded as a whole: every DataLoader worker gets its own
+    subset of shards and reads the metadata of a shard (`shard_XXXXX.json`) only when it
+    starts reading the shard, filters and text-encodes its records, then takes them
+    in order of their offsets. Records pass through a shuffle buffer of `shuffle_buffer`
+    records, then `bucket_size` records at a time are grouped into batches of similar
+    lengths (see `group_by_length`). Buffers hold index records only, audio is loaded
+    when a batch is yielded. The dataset yields lists of items, so the DataLoader is
+    created with `batch_size=None` and collates every list.
+
+    `len()` is only an estimate taken from the shard manifest (see `__len__`), the trainer
+    uses it as the epoch length unless `trainer.len_epoch` is set in the config.
+    """
+
+    def __init__(self, shards_dir, text_encoder: BaseTextEncoder, config_parser: ConfigParser,
+                 wave_augs=None, spec_augs=None, max_audio_length=None, max_text_length=None, fields=None,
+                 batch_size=None, max_frames=None, shuffle_buffer=256, bucket_size=512,
+                 shuffle=True, drop_last=False):
+        assert batch_size is not None or max_frames is not None, \
+            "You must provide batch_size or max_frames for StreamingShardDataset"
+        # PackedAudioDataset.__init__ loads the whole index, only the item processing is shared
+        self._init_processing(text_encoder, config_parser, wave_augs, spec_augs, fields)
+        self._shards_dir = shards_dir
+        self._shards = {}
+        self._manifest = load_shards_manifest(shards_dir)
+        assert self._manifest["sr"] == config_parser["preprocessing"]["sr"], \
+            f"Shards in {shards_dir} are sampled at {self._manifest['sr']}Hz, repack them for the current preprocessing"
+        self.max_audio_length = max_audio_length
+        self.max_text_length = max_text_length
+        self.batch_size = batch_size
+        self.max_frames = max_frames
+        self.shuffle_buffer = shuffle_buffer if shuffle else 1
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    def _get_worker_shards(self):
+        worker_info = get_worker_info()
+        shards = list(range(len(self._manifest["shards"])))
+        if worker_info is None:
+            if self.shuffle:
+                random.shuffle(shards)
+            return shards
+        if len(shards) < worker_info.num_workers and worker_info.id == 0:
+            logger.warning(f"{len(shards)} shards for {worker_info.num_workers} workers, some workers will idle")
+        if self.shuffle:
+            # workers of one epoch share the base seed, so they agree on the shard order
+            np.random.RandomState((worker_info.seed - worker_info.id) % 2 ** 32).shuffle(shards)
+        return shards[worker_info.id::worker_info.num_workers]
+
+    def _load_shard_index(self, shard):
+        index = load_shard_index(self._shards_dir, shard)
+        index.add_ragged_column("text_encoded", *self.text_encoder.encode_packed(*index.strings["text"]))
+        if self.max_audio_length is None and self.max_text_length is None:
+            return index
+        return self._filter_records_from_dataset(index, self.max_audio_length, self.max_text_length, None)
+
+    def _iter_records(self):
+        # records are read in shard order, the buffer shuffles them
+        buffer = []
+        for shard in self._get_worker_shards():
+            for record in self._load_shard_index(shard):
+                buffer.append(record)
+                if len(buffer) >= self.shuffle_buffer:
+                    yield buffer.pop(random.randrange(len(buffer)))
+        random.shuffle(buffer)
+        yield from buffer
+
+    def _batches(self, bucket):
+        # buffers hold index records only, audio is loaded when its batch is yielded
+        lengths = np.array([record["length"] for record in bucket], dtype=np.int64)
+        batches = group_by_length(lengths, self.batch_size, self.max_frames, self.drop_last)
+        if self.shuffle:
+            random.shuffle(batches)
+        for batch in batches:
+            yield [self.make_item(bucket[i]) for i in batch]
+
+    def __iter__(self):
+        bucket = []
+        for record in self._iter_records():
+            bucket.append(record)
+            if len(bucket) == self.bucket_size:
+                yield from self._batches(bucket)
+                bucket = []
+        if len(bucket) > 0:
+            yield from self._batches(bucket)
+
+    def __len__(self):
+        """
+        Estimated number of batches per epoch, from record counts and total durations of the shards.
+        Filtered records, partially filled batches of every bucket and worker aren't accounted for,
+        so an epoch may yield a few more or fewer batches. Set `trainer.len_epoch` for a fixed epoch length.
+        """
+        shards = self._manifest["shards"]
+        if self.batch_size is not None:
+            return math.ceil(sum(shard["records"] for shard in shards) / self.batch_size)
+        return math.ceil(sum(shard["samples"] for shard in shards) / self.max_frames)
+
+
+if __name__ == "__main__":
+    from hw_asr.utils import ROOT_PATH
+
+    text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+    config_parser = ConfigParser.get_default_configs()
+
+    # shards are written by `python -m hw_asr.datasets.packed_audio_dataset`
+    shards_dir = ROOT_PATH / "data" / "datasets" / "librispeech" / "packed" / "dev-clean"
+    ds = StreamingShardDataset(shards_dir, max_frames=16000 * 60, text_encoder=text_encoder,
+                               config_parser=config_parser)
+    for batch in ds:
+        print(len(batch), [item["duration"] for item in batch])
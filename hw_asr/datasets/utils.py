@@ -1,23 +1,40 @@
+from functools import partial
 from operator import xor
-from tqdm import trange
 import logging
 
-from torch.utils.data import DataLoader, ConcatDataset
+import numpy as np
+from torch.utils.data import DataLoader, ConcatDataset, IterableDataset
 
 import hw_asr.augmentations
 import hw_asr.batch_sampler as batch_sampler_module
 import hw_asr.datasets
 from hw_asr.base.base_text_encoder import BaseTextEncoder
-from hw_asr.collate_fn.collate import collate_fn
+from hw_asr.collate_fn.collate import collate_fn, collated_fields
 from hw_asr.utils.parse_config import ConfigParser
 
 logger = logging.getLogger(__name__)
 
 
+class LengthConcatDataset(ConcatDataset):
+    """
+    ConcatDataset which also concatenates lengths of the joined datasets
+    """
+
+    def get_lengths(self) -> np.ndarray:
+        return np.concatenate([ds.get_lengths() for ds in self.datasets])
+
+
 def get_dataloaders(configs: ConfigParser, text_encoder: BaseTextEncoder):
     dataloaders = {}
     for split, params in configs["data"].items():
         num_workers = params.get("num_workers", 1)
+        pin_memory = params.get("pin_memory", False)
+        # datasets return only what collate_fn consumes, unless fields are set explicitly
+        fields = params.get("fields", collated_fields(configs["preprocessing"].get("batch_frontend", False)))
+        # workers collate into shared memory, DataLoader pins their batches itself
+        collate = partial(
+            collate_fn, pad_to_multiple=params.get("pad_to_multiple"), pin_memory=pin_memory and num_workers == 0
+        )
 
         # set train augmentations
         if split == 'train':
@@ -32,10 +49,23 @@ def get_dataloaders(configs: ConfigParser, text_encoder: BaseTextEncoder):
         for ds in params["datasets"]:
             datasets.append(configs.init_obj(
                 ds, hw_asr.datasets, text_encoder=text_encoder, config_parser=configs,
-                wave_augs=wave_augs, spec_augs=spec_augs))
+                wave_augs=wave_augs, spec_augs=spec_augs, fields=fields))
         assert len(datasets)
+        if isinstance(datasets[0], IterableDataset):
+            # streaming datasets batch records themselves
+            assert len(datasets) == 1, "Streaming dataset can't be joined with other datasets"
+            if split == "train" and configs["trainer"].get("len_epoch") is None:
+                logger.warning(
+                    f"Length of a streaming epoch is estimated as {len(datasets[0])} batches, "
+                    "set trainer.len_epoch to fix it"
+                )
+            dataloaders[split] = DataLoader(
+                datasets[0], batch_size=None, collate_fn=collate,
+                num_workers=num_workers, pin_memory=pin_memory
+            )
+            continue
         if len(datasets) > 1:
-            dataset = ConcatDataset(datasets)
+            dataset = LengthConcatDataset(datasets)
         else:
             dataset = datasets[0]
 
@@ -47,20 +77,20 @@ def get_dataloaders(configs: ConfigParser, text_encoder: BaseTextEncoder):
             shuffle = True
             batch_sampler = None
             dataloader = DataLoader(
-                dataset, batch_size=bs, collate_fn=collate_fn,
+                dataset, batch_size=bs, collate_fn=collate,
                 shuffle=shuffle, num_workers=num_workers,
-                batch_sampler=batch_sampler, drop_last=drop_last
+                batch_sampler=batch_sampler, drop_last=drop_last, pin_memory=pin_memory
             )
         elif "batch_sampler" in params:
             # get frame length for batch sampler
             logger.info("Getting lengths for dynamic batch sampling")
-            sample_lengths = [dataset[i]['frames'] for i in trange(len(dataset))]
+            sample_lengths = dataset.get_lengths().tolist()
             batch_sampler = configs.init_obj(params["batch_sampler"], batch_sampler_module,
                                              dataset=dataset, lengths_list=sample_lengths, drop_last=drop_last)
             dataloader = DataLoader(
-                dataset, collate_fn=collate_fn,
+                dataset, collate_fn=collate,
                 num_workers=num_workers,
-                batch_sampler=batch_sampler
+                batch_sampler=batch_sampler, pin_memory=pin_memory
             )
         else:
             raise Exception()
@@ -0,0 +1,5 @@
+from hw_asr.frontend.log_mel import LogMelFrontend
+
+__all__ = [
+    "LogMelFrontend",
+]
@@ -0,0 +1,51 @@
+import torch
+import torchaudio
+from torch import nn, Tensor
+
+from hw_asr.utils.parse_config import ConfigParser
+
+
+class LogMelFrontend(nn.Module):
+    """
+    Computes log-spectrograms for a whole padded batch of waveforms in one call.
+    Used when `preprocessing.batch_frontend` is set and dataset workers return waveforms only,
+    so FFT setup is done once and the transform runs on the training device.
+    `spec_augs` are batch augmentations (see `hw_asr.augmentations.batch_spec_from_configs`),
+    applied to the padded batch in training mode.
+    """
+
+    def __init__(self, config_parser: ConfigParser, spec_augs=None):
+        super().__init__()
+        self.wave2spec = config_parser.init_obj(
+            config_parser["preprocessing"]["spectrogram"],
+            torchaudio.transforms,
+        )
+        stft = getattr(self.wave2spec, "spectrogram", self.wave2spec)
+        self.hop_length = stft.hop_length
+        self.n_fft = stft.n_fft
+        self.center = stft.center
+        self.spec_augs = spec_augs
+
+    def transform_lengths(self, audio_length: Tensor) -> Tensor:
+        if self.center:
+            return audio_length // self.hop_length + 1
+        return (audio_length - self.n_fft) // self.hop_length + 1
+
+    def forward(self, audio: Tensor, audio_length: Tensor, *args, **kwargs):
+        """
+        :param audio: (batch, time) padded waveforms
+        :param audio_length: (batch,) lengths of waveforms
+        :return: dict with (batch, time, n_feats) spectrogram and its lengths, same as collate_fn gives
+        """
+        spectrogram = self.wave2spec(audio).clamp(1e-5).log()
+        spectrogram_length = self.transform_lengths(audio_length.long()).int()
+        # zero padding frames, like pad_sequence does for per-item spectrograms
+        padding = torch.arange(spectrogram.shape[-1], device=spectrogram.device)[None] \
+            >= spectrogram_length.to(spectrogram.device)[:, None]
+        spectrogram = spectrogram.masked_fill(padding[:, None, :], 0).transpose(1, 2)
+        if self.spec_augs is not None and self.training:
+            spectrogram, spectrogram_length = self.spec_augs(spectrogram, spectrogram_length)
+        return {
+            "spectrogram": spectrogram,
+            "spectrogram_length": spectrogram_length,
+        }
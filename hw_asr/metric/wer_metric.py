@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 import torch
 from torch import Tensor
@@ -13,13 +13,15 @@ class ArgmaxWERMetric(BaseMetric):
         super().__init__(*args, **kwargs)
         self.text_encoder = text_encoder
 
-    def __call__(self, log_probs: Tensor, text: List[str], *args, **kwargs):
-        wers = []
-        predictions = torch.argmax(log_probs.cpu(), dim=-1)
-        for log_prob_vec, target_text in zip(predictions, text):
-            if hasattr(self.text_encoder, "ctc_decode"):
-                pred_text = self.text_encoder.ctc_decode(log_prob_vec)
-            else:
-                pred_text = self.text_encoder.decode(log_prob_vec)
-            wers.append(calc_wer(BaseTextEncoder.normalize_text(target_text), pred_text))
+    def __call__(self, log_probs: Tensor, text: List[str], log_probs_length: Optional[Tensor] = None,
+                 *args, **kwargs):
+        predictions = torch.argmax(log_probs.detach(), dim=-1).cpu()
+        if hasattr(self.text_encoder, "ctc_decode_batch"):
+            pred_texts = self.text_encoder.ctc_decode_batch(predictions, log_probs_length)
+        else:
+            pred_texts = [self.text_encoder.decode(log_prob_vec) for log_prob_vec in predictions]
+        wers = [
+            calc_wer(BaseTextEncoder.normalize_text(target_text), pred_text)
+            for pred_text, target_text in zip(pred_texts, text)
+        ]
         return sum(wers) / len(wers)
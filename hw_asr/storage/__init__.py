@@ -0,0 +1,8 @@
+from hw_asr.storage.audio_shards import AudioShardWriter, pack_dataset
+from hw_asr.storage.feature_cache import FeatureCache
+
+__all__ = [
+    "AudioShardWriter",
+    "pack_dataset",
+    "FeatureCache",
+]
@@ -0,0 +1,166 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import Tensor
+from tqdm import tqdm
+
+from hw_asr.storage.columnar_index import ColumnarIndex
+
+logger = logging.getLogger(__name__)
+
+SHARD_INDEX_DTYPE = np.dtype([("shard", np.int32), ("offset", np.int64), ("length", np.int64)])
+
+
+def shard_path(shards_dir, shard: int) -> Path:
+    return Path(shards_dir) / f"shard_{shard:05d}.pcm"
+
+
+def shard_meta_path(shards_dir, shard: int) -> Path:
+    return Path(shards_dir) / f"shard_{shard:05d}.json"
+
+
+class AudioShardWriter:
+    """
+    Writes waveforms as raw int16 PCM into a few large shard files.
+    Location of every record is kept in a binary (shard, offset, length) index,
+    offsets and lengths are counted in samples.
+    Records of every shard are also written next to it (`shard_XXXXX.json`) with a
+    `shards.json` manifest, so that streaming readers load only the shards they read.
+    """
+
+    def __init__(self, out_dir, sr: int, max_shard_bytes: int = 1 << 30):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(exist_ok=True, parents=True)
+        self.sr = sr
+        self.max_shard_bytes = max_shard_bytes
+        self._locations = []
+        self._records = []
+        self._shard = -1
+        self._shard_samples = 0
+        self._file = None
+
+    def _next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        self._shard += 1
+        self._shard_samples = 0
+        self._file = shard_path(self.out_dir, self._shard).open("wb")
+
+    def add(self, wave: Tensor, record: dict):
+        """
+        Appends a (1, time) float waveform sampled at `sr` with its index entry
+        (path, text, ...). Returns id of the record.
+        """
+        samples = (wave.reshape(-1).clamp(-1, 1) * 32767).round().to(torch.int16).numpy()
+        if self._file is None or (self._shard_samples + len(samples)) * 2 > self.max_shard_bytes:
+            self._next_shard()
+        self._file.write(samples.tobytes())
+        self._locations.append((self._shard, self._shard_samples, len(samples)))
+        self._shard_samples += len(samples)
+        self._records.append({**record, "audio_len": len(samples) / self.sr})
+        return len(self._records) - 1
+
+    def update_record(self, record_id: int, **fields):
+        """
+        Sets fields of an added record, e.g. a transcription that is read after the audio
+        """
+        self._records[record_id].update(fields)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        np.save(str(self.out_dir / "shards_index.npy"), np.array(self._locations, dtype=SHARD_INDEX_DTYPE))
+        with (self.out_dir / "index.json").open("w") as f:
+            json.dump({"sr": self.sr, "index": self._records}, f, indent=2)
+
+        shards = [{"records": 0, "samples": 0} for _ in range(self._shard + 1)]
+        shard_records = [[] for _ in range(self._shard + 1)]
+        for (shard, offset, length), record in zip(self._locations, self._records):
+            shards[shard]["records"] += 1
+            shards[shard]["samples"] += length
+            shard_records[shard].append({**record, "offset": offset, "length": length})
+        for shard, records in enumerate(shard_records):
+            with shard_meta_path(self.out_dir, shard).open("w") as f:
+                json.dump(records, f)
+        with (self.out_dir / "shards.json").open("w") as f:
+            json.dump({"sr": self.sr, "shards": shards}, f, indent=2)
+        logger.info(f"Packed {len(self._records)} records into {self._shard + 1} shards in {self.out_dir}")
+
+
+def pack_dataset(dataset, out_dir, max_shard_bytes: int = 1 << 30):
+    """
+    Decodes (and resamples) every record of a dataset once and writes them into PCM shards.
+    Records are written in the order of the dataset index, i.e. sorted by duration.
+    """
+    writer = AudioShardWriter(out_dir, dataset.config_parser["preprocessing"]["sr"], max_shard_bytes)
+    for entry in tqdm(dataset._index, desc=f"Packing audio into {out_dir}"):
+        wave = dataset.load_audio(entry["path"])
+        writer.add(wave, {"path": entry["path"], "text": entry["text"]})
+    writer.close()
+
+
+def load_shards_index(shards_dir):
+    """
+    Returns sample rate and the index with (shard, offset, length) columns filled in.
+    """
+    shards_dir = Path(shards_dir)
+    with (shards_dir / "index.json").open() as f:
+        meta = json.load(f)
+    locations = np.load(str(shards_dir / "shards_index.npy"))
+    index = ColumnarIndex.from_records(meta["index"])
+    assert len(index) == len(locations), f"Broken shards index in {shards_dir}"
+    for key in SHARD_INDEX_DTYPE.names:
+        index.add_column(key, locations[key])
+    return meta["sr"], index
+
+
+def load_shards_manifest(shards_dir) -> dict:
+    """
+    Returns {"sr": sample rate, "shards": [{"records": count, "samples": total length}, ...]}
+    """
+    manifest_path = Path(shards_dir) / "shards.json"
+    assert manifest_path.exists(), f"No {manifest_path}, repack {shards_dir} to stream it"
+    with manifest_path.open() as f:
+        return json.load(f)
+
+
+def load_shard_index(shards_dir, shard: int) -> ColumnarIndex:
+    """
+    Index of the records of one shard with (shard, offset, length) columns, in order of offsets
+    """
+    with shard_meta_path(shards_dir, shard).open() as f:
+        index = ColumnarIndex.from_records(json.load(f))
+    index.add_column("shard", np.full(len(index), shard, dtype=np.int32))
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from hw_asr.datasets import CustomDirAudioDataset
+    from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+    from hw_asr.utils.parse_config import ConfigParser
+
+    args = argparse.ArgumentParser(
+        description="Decode and resample a directory of audio once into PCM shards for PackedAudioDataset"
+    )
+    args.add_argument("audio_dir", type=str, help="directory with audio files")
+    args.add_argument("out_dir", type=str, help="directory to write shards into")
+    args.add_argument("-t", "--transcription-dir", default=None, type=str,
+                      help="directory with <audio name>.txt transcriptions")
+    args.add_argument("--sr", default=16000, type=int, help="target sample rate")
+    args.add_argument("--max-shard-bytes", default=1 << 30, type=int, help="maximum size of a shard")
+    args = args.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config_parser = ConfigParser.get_default_configs()
+    config_parser["preprocessing"]["sr"] = args.sr
+    dataset = CustomDirAudioDataset(
+        args.audio_dir, args.transcription_dir,
+        text_encoder=CTCCharTextEncoder.get_simple_alphabet(), config_parser=config_parser
+    )
+    pack_dataset(dataset, args.out_dir, args.max_shard_bytes)
@@ -0,0 +1,190 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    utf-8 bytes of all strings in one uint8 array and offsets of every string in it
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+def _take_ragged(offsets: np.ndarray, data: np.ndarray, indices: np.ndarray):
+    starts = offsets[indices]
+    lengths = offsets[indices + 1] - starts
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    # position of every output element in the source array
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return new_offsets, data[positions]
+
+
+def _concat_ragged(columns: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets, data, shift = [np.zeros(1, dtype=np.int64)], [], 0
+    for column_offsets, column_data in columns:
+        offsets.append(column_offsets[1:] + shift)
+        data.append(column_data)
+        shift += len(column_data)
+    return np.concatenate(offsets), np.concatenate(data)
+
+
+class IndexRecord:
+    """
+    Read-only dict-like view of one record of a ColumnarIndex.
+    Values are read from the columns on access, so records don't own any Python objects
+    whose refcounts DataLoader workers would touch (and copy-on-write pages with them).
+    """
+
+    __slots__ = ("_index", "_ind")
+
+    def __init__(self, index: "ColumnarIndex", ind: int):
+        self._index = index
+        self._ind = ind
+
+    def __getitem__(self, key):
+        if key in self._index.numeric:
+            return self._index.numeric[key][self._ind].item()
+        if key in self._index.strings:
+            return self._index.get_string(key, self._ind)
+        if key in self._index.ragged:
+            return self._index.get_ragged(key, self._ind)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return list(self._index.numeric) + list(self._index.strings) + list(self._index.ragged)
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self):
+        return f"IndexRecord({self.to_dict()})"
+
+
+class ColumnarIndex:
+    """
+    Dataset index stored column-wise.
+    Numeric fields (audio_len, ...) are numpy arrays, string fields (path, text, ...) are
+    packed into a single utf-8 byte array with offsets. Ragged fields (encoded texts, ...)
+    are packed the same way, records get views into the packed array.
+    Loading it from disk is a handful of array reads and filtering/sorting are vectorized
+    `take` operations.
+    """
+
+    def __init__(self, numeric: Dict[str, np.ndarray], strings: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                 ragged: Dict[str, Tuple[np.ndarray, np.ndarray]] = None):
+        self.numeric = numeric
+        self.strings = strings
+        self.ragged = ragged if ragged is not None else {}
+        sizes = {len(v) for v in numeric.values()}
+        sizes |= {len(off) - 1 for off, _ in list(strings.values()) + list(self.ragged.values())}
+        assert len(sizes) <= 1, "All columns of the index must have the same length"
+        self._size = sizes.pop() if sizes else 0
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> "ColumnarIndex":
+        keys = list(records[0].keys()) if len(records) else ["path", "text", "audio_len"]
+        numeric, strings = {}, {}
+        for key in keys:
+            values = [record[key] for record in records]
+            if len(values) and all(isinstance(v, str) for v in values) or key in ("path", "text"):
+                strings[key] = pack_strings(values)
+            else:
+                numeric[key] = np.asarray(values)
+        return cls(numeric, strings)
+
+    @classmethod
+    def concat(cls, indexes: List["ColumnarIndex"]) -> "ColumnarIndex":
+        numeric = {
+            key: np.concatenate([index.numeric[key] for index in indexes])
+            for key in indexes[0].numeric
+        }
+        strings = {key: _concat_ragged([index.strings[key] for index in indexes]) for key in indexes[0].strings}
+        ragged = {key: _concat_ragged([index.ragged[key] for index in indexes]) for key in indexes[0].ragged}
+        return cls(numeric, strings, ragged)
+
+    def save(self, path):
+        arrays = {f"numeric:{key}": value for key, value in self.numeric.items()}
+        for key, (offsets, data) in self.strings.items():
+            arrays[f"offsets:{key}"] = offsets
+            arrays[f"data:{key}"] = data
+        for key, (offsets, data) in self.ragged.items():
+            arrays[f"ragged_offsets:{key}"] = offsets
+            arrays[f"ragged_data:{key}"] = data
+        with Path(path).open("wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "ColumnarIndex":
+        numeric, offsets, data, ragged_offsets, ragged_data = {}, {}, {}, {}, {}
+        with np.load(str(path)) as arrays:
+            for name in arrays.files:
+                kind, key = name.split(":", 1)
+                {
+                    "numeric": numeric, "offsets": offsets, "data": data,
+                    "ragged_offsets": ragged_offsets, "ragged_data": ragged_data,
+                }[kind][key] = arrays[name]
+        return cls(
+            numeric,
+            {key: (offsets[key], data[key]) for key in offsets},
+            {key: (ragged_offsets[key], ragged_data[key]) for key in ragged_offsets},
+        )
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return key in self.numeric or key in self.strings or key in self.ragged
+
+    def column(self, key) -> np.ndarray:
+        return self.numeric[key]
+
+    def get_string(self, key, ind) -> str:
+        offsets, data = self.strings[key]
+        return data[offsets[ind]: offsets[ind + 1]].tobytes().decode("utf-8")
+
+    def get_strings(self, key) -> List[str]:
+        return [self.get_string(key, i) for i in range(len(self))]
+
+    def get_ragged(self, key, ind) -> np.ndarray:
+        """
+        View of the record's part of a ragged column, no data is copied
+        """
+        offsets, data = self.ragged[key]
+        return data[offsets[ind]: offsets[ind + 1]]
+
+    def add_column(self, key, values: np.ndarray):
+        assert len(values) == len(self)
+        self.numeric[key] = np.asarray(values)
+
+    def add_ragged_column(self, key, offsets: np.ndarray, data: np.ndarray):
+        assert len(offsets) == len(self) + 1 and offsets[-1] == len(data)
+        self.ragged[key] = (offsets, data)
+
+    def take(self, indices) -> "ColumnarIndex":
+        indices = np.asarray(indices, dtype=np.int64)
+        numeric = {key: value[indices] for key, value in self.numeric.items()}
+        strings = {key: _take_ragged(offsets, data, indices) for key, (offsets, data) in self.strings.items()}
+        ragged = {key: _take_ragged(offsets, data, indices) for key, (offsets, data) in self.ragged.items()}
+        return ColumnarIndex(numeric, strings, ragged)
+
+    def __iter__(self):
+        for ind in range(len(self)):
+            yield self[ind]
+
+    def __getitem__(self, ind) -> IndexRecord:
+        ind = int(ind)
+        if not -len(self) <= ind < len(self):
+            raise IndexError(f"Index {ind} is out of range for {len(self)} records")
+        return IndexRecord(self, ind % len(self))
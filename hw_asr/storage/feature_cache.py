@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from hw_asr.storage.columnar_index import ColumnarIndex
+
+logger = logging.getLogger(__name__)
+
+
+def preprocessing_hash(preprocessing: dict) -> str:
+    dumped = json.dumps(preprocessing, sort_keys=True)
+    return hashlib.sha1(dumped.encode()).hexdigest()[:16]
+
+
+class FeatureCache:
+    """
+    On-disk store of log-spectrograms of one dataset part.
+
+    Features of all records live in a single float16 memmap of shape (total_frames, n_feats).
+    Record `i` of the index the cache was built for owns a preallocated slot of rows
+    starting at `offsets[i]`, slots are filled lazily and `lengths[i] == -1` marks a slot
+    that wasn't computed yet.
+    The store is placed in `cache_dir / hash(preprocessing)`, so changing preprocessing
+    config never returns stale features. With `speed` != 1 the store keeps features of
+    speed perturbed audio.
+    """
+
+    def __init__(self, cache_dir, index: ColumnarIndex, preprocessing: dict, wave2spec, speed: float = 1.0):
+        if speed != 1.0:
+            preprocessing = {**preprocessing, "speed": speed}
+        self.speed = speed
+        self._dir = Path(cache_dir) / preprocessing_hash(preprocessing)
+        path_offsets, path_data = index.strings["path"]
+
+        meta = {
+            "preprocessing": preprocessing,
+            "paths_hash": hashlib.sha1(path_offsets.tobytes() + path_data.tobytes()).hexdigest(),
+            "n_feats": self._get_n_feats(wave2spec),
+        }
+        meta_path = self._dir / "meta.json"
+        if meta_path.exists():
+            with meta_path.open() as f:
+                if json.load(f) != meta:
+                    logger.warning(f"Feature cache {self._dir} doesn't match the index. Rebuilding it.")
+                    meta_path.unlink()
+        if not meta_path.exists():
+            self._create(index, preprocessing["sr"], wave2spec.hop_length, meta["n_feats"])
+            with meta_path.open("w") as f:
+                json.dump(meta, f, indent=2)
+
+        self.n_feats = meta["n_feats"]
+        self._offsets = np.load(str(self._dir / "offsets.npy"))
+        self._capacity = np.load(str(self._dir / "capacity.npy"))
+        self._features = None
+        self._lengths = None
+
+    @staticmethod
+    def _get_n_feats(wave2spec):
+        with torch.no_grad():
+            return wave2spec(torch.zeros(1, 4 * wave2spec.hop_length)).shape[-2]
+
+    def _create(self, index, sr, hop_length, n_feats):
+        logger.info(f"Creating feature cache in {self._dir}")
+        self._dir.mkdir(exist_ok=True, parents=True)
+        # centered STFT gives `n_samples // hop_length + 1` frames, keep a frame of slack for rounding
+        n_samples = np.ceil(index.column("audio_len").astype(np.float64) * sr / self.speed).astype(np.int64)
+        capacity = n_samples // hop_length + 2
+        offsets = np.zeros_like(capacity)
+        offsets[1:] = np.cumsum(capacity)[:-1]
+        np.save(str(self._dir / "capacity.npy"), capacity)
+        np.save(str(self._dir / "offsets.npy"), offsets)
+        lengths = np.lib.format.open_memmap(
+            str(self._dir / "lengths.npy"), mode="w+", dtype=np.int32, shape=(len(index),)
+        )
+        lengths[:] = -1
+        lengths.flush()
+        features = np.memmap(
+            str(self._dir / "features.f16"), mode="w+", dtype=np.float16,
+            shape=(max(int(capacity.sum()), 1), n_feats)
+        )
+        features.flush()
+
+    def _open(self):
+        # memmaps are opened lazily, so that every DataLoader worker maps the files by itself
+        if self._features is None:
+            self._lengths = np.load(str(self._dir / "lengths.npy"), mmap_mode="r+")
+            self._features = np.memmap(
+                str(self._dir / "features.f16"), mode="r+", dtype=np.float16
+            ).reshape(-1, self.n_feats)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_features"] = None
+        state["_lengths"] = None
+        return state
+
+    def get(self, slot: int) -> Optional[Tensor]:
+        """
+        Returns cached spectrogram of shape (1, n_feats, time) or None if it wasn't computed yet.
+        """
+        self._open()
+        length = int(self._lengths[slot])
+        if length < 0:
+            return None
+        offset = self._offsets[slot]
+        features = self._features[offset: offset + length].astype(np.float32)
+        return torch.from_numpy(features).T.unsqueeze(0)
+
+    def put(self, slot: int, spectrogram: Tensor):
+        length = spectrogram.shape[-1]
+        if length > self._capacity[slot]:
+            logger.warning(f"Spectrogram of record {slot} doesn't fit into its cache slot. Not caching it.")
+            return
+        self._open()
+        offset = self._offsets[slot]
+        self._features[offset: offset + length] = spectrogram.reshape(self.n_feats, length).T.numpy()
+        # length is written last: readers never see a partially written slot as filled
+        self._lengths[slot] = length
@@ -0,0 +1,71 @@
+import io
+import logging
+import tarfile
+from pathlib import Path
+
+import torchaudio
+from tqdm import tqdm
+
+from hw_asr.storage.audio_shards import AudioShardWriter
+from hw_asr.utils import get_resampler
+
+logger = logging.getLogger(__name__)
+
+
+def pack_librispeech_archive(archive_path, out_dir, sr: int = 16000, max_shard_bytes: int = 1 << 30):
+    """
+    Packs a LibriSpeech part straight from its .tar.gz into PCM shards for PackedAudioDataset.
+    The archive is read as a stream, member by member, FLACs are decoded from memory and
+    nothing is extracted to disk. Transcriptions may come before or after the audio of a
+    chapter, they are attached to the records when the archive ends.
+    """
+    writer = AudioShardWriter(out_dir, sr, max_shard_bytes)
+    utterances = {}
+    texts = {}
+    with tarfile.open(str(archive_path), mode="r|gz") as archive:
+        for member in tqdm(archive, desc=f"Packing {archive_path}"):
+            if not member.isfile():
+                continue
+            name = member.name
+            if name.endswith(".trans.txt"):
+                for line in archive.extractfile(member).read().decode("utf-8").splitlines():
+                    if line.strip():
+                        f_id, f_text = line.split(" ", 1)
+                        texts[f_id] = f_text.strip().lower()
+            elif name.endswith(".flac"):
+                wave, wave_sr = torchaudio.load(io.BytesIO(archive.extractfile(member).read()), format="flac")
+                wave = wave[0:1]
+                if wave_sr != sr:
+                    wave = get_resampler(wave_sr, sr)(wave)
+                utterances[Path(name).stem] = writer.add(wave, {"path": name, "text": ""})
+    missing = sorted(set(utterances) - set(texts))
+    assert len(missing) == 0, f"No transcriptions for {len(missing)} utterances, e.g. {missing[0]}"
+    for f_id, record_id in utterances.items():
+        writer.update_record(record_id, text=texts[f_id])
+    writer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from hw_asr.datasets.packed_audio_dataset import PackedAudioDataset
+    from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+    from hw_asr.utils.parse_config import ConfigParser
+
+    args = argparse.ArgumentParser(description="Pack a local LibriSpeech .tar.gz into PCM shards")
+    args.add_argument("archive", type=str, help="path to e.g. dev-clean.tar.gz")
+    args.add_argument("out_dir", type=str, help="directory to write shards into")
+    args.add_argument("--sr", default=16000, type=int, help="target sample rate")
+    args.add_argument("--max-shard-bytes", default=1 << 30, type=int, help="maximum size of a shard")
+    args = args.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pack_librispeech_archive(args.archive, args.out_dir, args.sr, args.max_shard_bytes)
+
+    text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+    config_parser = ConfigParser.get_default_configs()
+    config_parser["preprocessing"]["sr"] = args.sr
+
+    ds = PackedAudioDataset(args.out_dir, text_encoder=text_encoder, config_parser=config_parser)
+    item = ds[0]
+    print(item)
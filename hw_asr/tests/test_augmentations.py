@@ -0,0 +1,127 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchaudio
+
+from hw_asr.augmentations.batch_augmentations import (
+    BatchBackgroundNoise, BatchGain, BatchGaussianNoise, BatchImpulseResponse, BatchSpecAug, BatchSpeedPerturb
+)
+from hw_asr.augmentations.ir_bank import ImpulseResponseBank
+from hw_asr.augmentations.noise_bank import NoiseBank
+from hw_asr.augmentations.wave_augmentations import BackgroundNoise, SpeedPerturb
+
+
+class TestBatchAugmentations(unittest.TestCase):
+    def test_wave_augmentations(self):
+        lengths = torch.tensor([16000, 8000, 100])
+        audio = torch.zeros(3, 16000)
+        for i, length in enumerate(lengths):
+            audio[i, :length] = torch.rand(length) - 0.5
+
+        noised, _ = BatchGaussianNoise(mu=0, sigma=0.05, prob=1.)(audio, lengths)
+        gained, _ = BatchGain(min_gain_in_db=-6, max_gain_in_db=6, p=1.)(audio, lengths)
+        for i, length in enumerate(lengths):
+            self.assertTrue((noised[i, length:] == 0).all())
+            self.assertTrue((gained[i, length:] == 0).all())
+        self.assertFalse(torch.equal(noised, audio))
+
+        self.assertTrue(torch.equal(BatchGaussianNoise(mu=0, sigma=0.05, prob=0.)(audio, lengths)[0], audio))
+
+    def test_spec_aug(self):
+        lengths = torch.tensor([200, 50])
+        spectrogram = torch.zeros(2, 200, 128)
+        for i, length in enumerate(lengths):
+            spectrogram[i, :length] = torch.rand(length, 128) + 1
+
+        masked, _ = BatchSpecAug(freq_mask=20, time_mask=40, prob=1.)(spectrogram, lengths)
+        self.assertEqual(masked.shape, spectrogram.shape)
+        for i, length in enumerate(lengths):
+            # masks only zero values out
+            changed = masked[i] != spectrogram[i]
+            self.assertTrue((masked[i][changed] == 0).all())
+            # every frequency band/time span is shorter than its limit
+            self.assertLess((masked[i, :length] == 0).all(dim=0).sum().item(), 20)
+            self.assertLess((masked[i, :length] == 0).all(dim=1).sum().item(), 40)
+
+    def test_speed_perturb(self):
+        lengths = torch.tensor([16000, 8000])
+        audio = torch.zeros(2, 16000)
+        for i, length in enumerate(lengths):
+            audio[i, :length] = torch.rand(length) - 0.5
+
+        perturbed, new_lengths = BatchSpeedPerturb(rates=[1.1], sr=16000)(audio, lengths)
+        self.assertEqual(new_lengths.tolist(), [14546, 7273])
+        self.assertEqual(perturbed.shape, (2, 14546))
+        self.assertTrue((perturbed[1, 7273:] == 0).all())
+
+        wave = SpeedPerturb(rates=[0.9], sr=16000)(audio[:1])
+        self.assertEqual(wave.shape, (1, 17778))
+
+    def test_impulse_response(self):
+        with tempfile.TemporaryDirectory() as ir_dir:
+            irs = [torch.rand(1, 400) * torch.linspace(1, 0, 400), torch.rand(1, 1000) - 0.5]
+            for i, ir in enumerate(irs):
+                torchaudio.save(str(Path(ir_dir) / f"{i}.wav"), ir, 16000)
+            bank = ImpulseResponseBank(ir_dir, sr=16000, cache_path=str(Path(ir_dir) / "bank.npy"))
+            self.assertEqual((bank.n_irs, bank.ir_length), (2, 1000))
+
+            audio = torch.rand(2, 3000) - 0.5
+            ir_ids = torch.tensor([1, 0])
+            convolved = bank.convolve(audio, ir_ids)
+            saved_irs = np.load(str(Path(ir_dir) / "bank.npy"))
+            for i, ir_id in enumerate(ir_ids.tolist()):
+                expected = np.convolve(audio[i].numpy(), saved_irs[ir_id])[:3000]
+                self.assertTrue(np.allclose(convolved[i].numpy(), expected, atol=1e-4))
+
+            # loading from the memory mapped cache gives the same bank
+            cached = ImpulseResponseBank(ir_dir, sr=16000, cache_path=str(Path(ir_dir) / "bank.npy"))
+            self.assertIsNone(cached._irs)
+            self.assertTrue(torch.allclose(cached.convolve(audio, ir_ids), convolved))
+
+            # the cache is rebuilt for other parameters
+            truncated = ImpulseResponseBank(
+                ir_dir, sr=16000, cache_path=str(Path(ir_dir) / "bank.npy"), max_ir_length=0.025
+            )
+            self.assertEqual(truncated.ir_length, 400)
+            self.assertEqual(np.load(str(Path(ir_dir) / "bank.npy")).shape, (2, 400))
+
+            lengths = torch.tensor([3000, 1000])
+            audio[1, 1000:] = 0
+            reverberated, _ = BatchImpulseResponse(ir_dir, prob=1., sr=16000)(audio, lengths)
+            self.assertTrue((reverberated[1, 1000:] == 0).all())
+            self.assertFalse(torch.equal(reverberated, audio))
+
+    def test_background_noise(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for i, length in enumerate([3000, 5000]):
+                torchaudio.save(str(Path(tmp_dir) / f"{i}.wav"), torch.rand(1, length) - 0.5, 16000)
+            blob_path = str(Path(tmp_dir) / "noise" / "noise.pcm")
+            bank = NoiseBank(blob_path, sr=16000, noise_path=tmp_dir)
+            self.assertEqual(bank.n_samples, 8000)
+            # crops longer than the corpus loop over it
+            self.assertEqual(bank.crop(3, 20000).shape, (3, 20000))
+
+            audio = torch.rand(1, 16000) - 0.5
+            noised = BackgroundNoise(blob_path, prob=1., min_snr_db=10., max_snr_db=10.)(audio)
+            snr = 10 * torch.log10(audio.pow(2).sum() / (noised - audio).pow(2).sum())
+            self.assertAlmostEqual(snr.item(), 10., places=3)
+
+            lengths = torch.tensor([16000, 4000])
+            batch = torch.zeros(2, 16000)
+            batch[0], batch[1, :4000] = audio[0], audio[0, :4000]
+            noised, _ = BatchBackgroundNoise(blob_path, prob=1., min_snr_db=10., max_snr_db=10.)(batch, lengths)
+            self.assertTrue((noised[1, 4000:] == 0).all())
+            for i, length in enumerate(lengths):
+                noise = noised[i, :length] - batch[i, :length]
+                snr = 10 * torch.log10(batch[i, :length].pow(2).sum() / noise.pow(2).sum())
+                self.assertAlmostEqual(snr.item(), 10., places=3)
+
+            # the blob is rebuilt for another noise corpus, and reused without noise_path
+            other_dir = Path(tmp_dir) / "other"
+            other_dir.mkdir()
+            torchaudio.save(str(other_dir / "0.wav"), torch.rand(1, 1000) - 0.5, 16000)
+            self.assertEqual(NoiseBank(blob_path, sr=16000, noise_path=other_dir).n_samples, 1000)
+            self.assertEqual(NoiseBank(blob_path, sr=16000).n_samples, 1000)
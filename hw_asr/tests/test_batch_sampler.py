@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+from hw_asr.batch_sampler import GroupLengthBatchSampler
+
+
+class _LengthsDataset:
+    def __init__(self, lengths):
+        self.lengths = np.array(lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def get_lengths(self):
+        return self.lengths
+
+
+class TestBatchSampler(unittest.TestCase):
+    def test_group_length_batch_sampler(self):
+        lengths = np.random.randint(1000, 100000, size=500)
+        max_frames = 400000
+        sampler = GroupLengthBatchSampler(
+            _LengthsDataset(lengths), max_frames=max_frames, batches_per_group=5
+        )
+
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(sum(batches, [])), list(range(len(lengths))))
+        for batch in batches:
+            self.assertLessEqual(len(batch) * lengths[batch].max(), max_frames)
+        self.assertGreater(sampler.padding_efficiency, 0.9)
+
+    def test_batch_size_limit(self):
+        sampler = GroupLengthBatchSampler(
+            _LengthsDataset(np.arange(10, 0, -1)), batch_size=3, drop_last=True
+        )
+        batches = list(sampler)
+        self.assertEqual(len(batches), 3)
+        for batch in batches:
+            self.assertEqual(len(batch), 3)
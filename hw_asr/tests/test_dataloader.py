@@ -1,7 +1,14 @@
 import unittest
 
-from hw_asr.collate_fn.collate import collate_fn
+import torch
+from torch.utils.data import DataLoader
+
+import hw_asr.augmentations
+from hw_asr.augmentations.batch_augmentations import BatchSpecAug
+from hw_asr.collate_fn.collate import COLLATED_FIELDS, collate_fn, collated_fields
 from hw_asr.datasets import LibrispeechDataset
+from hw_asr.datasets.utils import LengthConcatDataset
+from hw_asr.frontend import LogMelFrontend
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
 from hw_asr.utils.parse_config import ConfigParser
 
@@ -39,3 +46,89 @@ class TestDataloader(unittest.TestCase):
         self.assertEqual(bs, BS)
 
         return batch
+
+    def test_lengths(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        ds = LibrispeechDataset(
+            "dev-clean", text_encoder=text_encoder, config_parser=config_parser
+        )
+        lengths = ds.get_lengths()
+        self.assertEqual(len(lengths), len(ds))
+        for i in range(3):
+            self.assertEqual(lengths[i], ds[i]["frames"])
+
+        concat_ds = LengthConcatDataset([ds, ds])
+        self.assertEqual(len(concat_ds.get_lengths()), 2 * len(ds))
+
+    def test_batch_frontend(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        ds = LibrispeechDataset(
+            "dev-clean", text_encoder=text_encoder, config_parser=config_parser
+        )
+        BS = 3
+        batch = collate_fn([ds[i] for i in range(BS)])
+
+        config_parser["preprocessing"]["batch_frontend"] = True
+        wave_ds = LibrispeechDataset(
+            "dev-clean", text_encoder=text_encoder, config_parser=config_parser
+        )
+        wave_batch = collate_fn([wave_ds[i] for i in range(BS)])
+        self.assertNotIn("spectrogram", wave_batch)
+        wave_batch.update(LogMelFrontend(config_parser).eval()(**wave_batch))
+
+        self.assertEqual(batch["spectrogram"].shape, wave_batch["spectrogram"].shape)
+        self.assertTrue(
+            (batch["spectrogram_length"] == wave_batch["spectrogram_length"]).all()
+        )
+        # frames near the end of an utterance see zero padding instead of reflection
+        for i, length in enumerate(batch["spectrogram_length"].tolist()):
+            diff = batch["spectrogram"][i, :length - 2] - wave_batch["spectrogram"][i, :length - 2]
+            self.assertLess(diff.abs().max().item(), 1e-3)
+
+        # spectrogram augmentations are applied to the whole batch in training mode
+        config_parser.config["augmentations"] = {
+            "spectrogram": [{"type": "SpecAug", "args": {"freq_mask": 20, "time_mask": 100, "prob": 1.0}}]
+        }
+        spec_augs = hw_asr.augmentations.batch_spec_from_configs(config_parser)
+        self.assertIsInstance(spec_augs, BatchSpecAug)
+        augmented = LogMelFrontend(config_parser, spec_augs=spec_augs).train()(**wave_batch)
+        self.assertEqual(augmented["spectrogram"].shape, wave_batch["spectrogram"].shape)
+        self.assertGreater((augmented["spectrogram"] == 0).sum(), (wave_batch["spectrogram"] == 0).sum())
+
+    def test_worker_batches(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        ds = LibrispeechDataset(
+            "dev-clean", text_encoder=text_encoder, config_parser=config_parser,
+            fields=collated_fields(), limit=6
+        )
+        self.assertEqual(set(ds[0].keys()), set(COLLATED_FIELDS))
+
+        loader = DataLoader(ds, batch_size=3, collate_fn=collate_fn, num_workers=2)
+        for batch in loader:
+            # batches are built in shared memory by the workers
+            self.assertTrue(batch["spectrogram"].is_shared())
+            self.assertEqual(batch["text_encoded"].dtype, torch.int32)
+            self.assertEqual(batch["spectrogram_length"].dtype, torch.int32)
+
+    def test_pad_to_multiple(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        ds = LibrispeechDataset(
+            "dev-clean", text_encoder=text_encoder, config_parser=config_parser, limit=3
+        )
+        items = [ds[i] for i in range(3)]
+        batch = collate_fn(items)
+        padded = collate_fn(items, pad_to_multiple={"spectrogram": 64, "text_encoded": 16})
+        self.assertEqual(padded["spectrogram"].shape[1] % 64, 0)
+        self.assertEqual(padded["text_encoded"].shape[1] % 16, 0)
+        self.assertTrue(torch.equal(batch["spectrogram_length"], padded["spectrogram_length"]))
+        length = batch["spectrogram"].shape[1]
+        self.assertTrue(torch.equal(batch["spectrogram"], padded["spectrogram"][:, :length]))
+        self.assertTrue((padded["spectrogram"][:, length:] == 0).all())
@@ -1,8 +1,23 @@
+import io
+import json
+import math
+import tarfile
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
-from hw_asr.datasets import LibrispeechDataset, CustomDirAudioDataset
+import numpy as np
+import torch
+import torchaudio
+from torch.utils.data import DataLoader
+
+from hw_asr.datasets import custom_audio_dataset
+from hw_asr.datasets import LibrispeechDataset, CustomDirAudioDataset, PackedAudioDataset, StreamingShardDataset
+from hw_asr.storage.audio_shards import pack_dataset
+from hw_asr.storage.librispeech_archive import pack_librispeech_archive
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
-from hw_asr.utils import ROOT_PATH
+from hw_asr.utils import ROOT_PATH, get_resampler
 from hw_asr.utils.parse_config import ConfigParser
 
 
@@ -40,3 +55,261 @@ class TestDataset(unittest.TestCase):
         )
         item = ds[0]
         print(item)
+
+    def test_feature_cache(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        audio_dir = str(ROOT_PATH / "test_data" / "audio")
+        transc_dir = str(ROOT_PATH / "test_data" / "transcriptions")
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ds = CustomDirAudioDataset(
+                audio_dir,
+                transc_dir,
+                text_encoder=text_encoder,
+                config_parser=config_parser,
+                feature_cache_dir=cache_dir,
+            )
+            computed = ds[0]
+            cached = ds[0]
+            self.assertIsNotNone(computed["audio"])
+            self.assertIsNone(cached["audio"])
+            self.assertEqual(computed["spectrogram"].shape, cached["spectrogram"].shape)
+            self.assertTrue(
+                (computed["spectrogram"] - cached["spectrogram"]).abs().max() < 1e-2
+            )
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ds = CustomDirAudioDataset(
+                audio_dir,
+                transc_dir,
+                text_encoder=text_encoder,
+                config_parser=config_parser,
+                feature_cache_dir=cache_dir,
+                feature_cache_speeds=[0.9, 1.1],
+            )
+            # every record is served at every rate, lengths are known without loading the audio
+            n_records = len(ds._index) // 2
+            self.assertEqual(len(ds), 2 * n_records)
+            rates = {}
+            for i in range(len(ds)):
+                rates.setdefault(ds._index[i]["path"], set()).add(float(ds._index[i]["speed"]))
+            self.assertEqual(len(rates), n_records)
+            self.assertTrue(all(speeds == {0.9, 1.1} for speeds in rates.values()))
+            lengths = ds.get_lengths()
+            hop_length = ds._get_wave2spec().hop_length
+            for i in range(len(ds)):
+                n_frames = {ds[i]["spectrogram"].shape[-1] for _ in range(2)}
+                self.assertEqual(n_frames, {lengths[i] // hop_length + 1})
+
+            # wave augmentations are applied without the cache
+            with self.assertLogs("hw_asr.base.base_dataset", level="WARNING"):
+                CustomDirAudioDataset(
+                    audio_dir,
+                    transc_dir,
+                    text_encoder=text_encoder,
+                    config_parser=config_parser,
+                    wave_augs=lambda wave: wave,
+                    feature_cache_dir=cache_dir,
+                    feature_cache_speeds=[0.9, 1.1],
+                )
+
+    def test_packed_dataset(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        audio_dir = str(ROOT_PATH / "test_data" / "audio")
+        transc_dir = str(ROOT_PATH / "test_data" / "transcriptions")
+
+        ds = CustomDirAudioDataset(
+            audio_dir, transc_dir, text_encoder=text_encoder, config_parser=config_parser
+        )
+        with tempfile.TemporaryDirectory() as shards_dir:
+            # tiny shards to check reading across several files
+            pack_dataset(ds, shards_dir, max_shard_bytes=200000)
+            packed_ds = PackedAudioDataset(
+                shards_dir, text_encoder=text_encoder, config_parser=config_parser
+            )
+            self.assertEqual(len(packed_ds), len(ds))
+            for i in range(len(ds)):
+                item, packed_item = ds[i], packed_ds[i]
+                self.assertEqual(item["audio_path"], packed_item["audio_path"])
+                self.assertEqual(item["audio"].shape, packed_item["audio"].shape)
+                self.assertTrue((item["audio"] - packed_item["audio"]).abs().max() < 1e-4)
+
+    def test_streaming_dataset(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        audio_dir = str(ROOT_PATH / "test_data" / "audio")
+        transc_dir = str(ROOT_PATH / "test_data" / "transcriptions")
+
+        ds = CustomDirAudioDataset(
+            audio_dir, transc_dir, text_encoder=text_encoder, config_parser=config_parser
+        )
+        with tempfile.TemporaryDirectory() as shards_dir:
+            pack_dataset(ds, shards_dir, max_shard_bytes=200000)
+            streaming_ds = StreamingShardDataset(
+                shards_dir, batch_size=2, shuffle_buffer=2, bucket_size=4,
+                text_encoder=text_encoder, config_parser=config_parser
+            )
+            for num_workers in [0, 2]:
+                loader = DataLoader(streaming_ds, batch_size=None, collate_fn=list, num_workers=num_workers)
+                batches = list(loader)
+                # every record is read exactly once per epoch
+                paths = sorted(item["audio_path"] for batch in batches for item in batch)
+                self.assertEqual(paths, sorted(ds[i]["audio_path"] for i in range(len(ds))))
+                for batch in batches:
+                    self.assertLessEqual(len(batch), 2)
+            self.assertEqual(len(streaming_ds), math.ceil(len(ds) / 2))
+
+            # records are filtered per shard, while the shard is read
+            max_audio_length = float(np.median([ds[i]["duration"] for i in range(len(ds))]))
+            filtered_ds = StreamingShardDataset(
+                shards_dir, batch_size=2, max_audio_length=max_audio_length,
+                text_encoder=text_encoder, config_parser=config_parser
+            )
+            durations = [item["duration"] for batch in filtered_ds for item in batch]
+            self.assertEqual(
+                len(durations), sum(ds[i]["duration"] < max_audio_length for i in range(len(ds)))
+            )
+
+    def test_cached_resampler(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        with tempfile.TemporaryDirectory() as audio_dir:
+            audio_path = str(Path(audio_dir) / "44k.wav")
+            torchaudio.save(audio_path, torch.rand(1, 44100) - 0.5, 44100)
+            ds = CustomDirAudioDataset(audio_dir, text_encoder=text_encoder, config_parser=config_parser)
+            loaded = ds.load_audio(audio_path)
+            expected = torchaudio.functional.resample(torchaudio.load(audio_path)[0], 44100, 16000)
+        self.assertEqual(loaded.shape, (1, 16000))
+        self.assertTrue(torch.allclose(loaded, expected, atol=1e-5))
+        self.assertIs(get_resampler(44100, 16000), get_resampler(44100, 16000))
+
+    def test_custom_index_cache(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        with tempfile.TemporaryDirectory() as audio_dir, tempfile.TemporaryDirectory() as cache_dir:
+            for i in range(3):
+                torchaudio.save(str(Path(audio_dir) / f"{i}.wav"), torch.zeros(1, 16000 * (i + 1)), 16000)
+            # the cache directory is created on save
+            cache_path = Path(cache_dir) / "index_cache" / "index.json"
+
+            def make_dataset():
+                return CustomDirAudioDataset(
+                    audio_dir, text_encoder=text_encoder, config_parser=config_parser,
+                    index_cache_path=cache_path
+                )
+
+            probe = custom_audio_dataset._probe_audio_len
+            with mock.patch.object(custom_audio_dataset, "_probe_audio_len", side_effect=probe) as probed:
+                ds = make_dataset()
+                self.assertEqual(probed.call_count, 3)
+                self.assertEqual(sorted(ds.get_lengths().tolist()), [16000, 32000, 48000])
+
+                probed.reset_mock()
+                make_dataset()
+                self.assertEqual(probed.call_count, 0)
+
+                # changed files are probed again
+                torchaudio.save(str(Path(audio_dir) / "0.wav"), torch.zeros(1, 8000), 16000)
+                probed.reset_mock()
+                ds = make_dataset()
+                self.assertEqual(probed.call_count, 1)
+                self.assertEqual(sorted(ds.get_lengths().tolist()), [8000, 32000, 48000])
+
+                # entries of deleted files are dropped when the cache is saved
+                (Path(audio_dir) / "2.wav").unlink()
+                torchaudio.save(str(Path(audio_dir) / "3.wav"), torch.zeros(1, 4000), 16000)
+                make_dataset()
+                with cache_path.open() as f:
+                    self.assertEqual(sorted(Path(path).name for path in json.load(f)), ["0.wav", "1.wav", "3.wav"])
+
+            # without an explicit path nothing is cached
+            with mock.patch.object(custom_audio_dataset.CustomAudioDataset, "_save_index_cache") as save:
+                CustomDirAudioDataset(audio_dir, text_encoder=text_encoder, config_parser=config_parser)
+                save.assert_not_called()
+
+    def test_librispeech_index(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            # a tiny part of two chapters, the index is built by a process pool
+            for speaker, chapter in [("2", "20"), ("1", "10")]:
+                chapter_dir = Path(data_dir) / "dev-clean" / speaker / chapter
+                chapter_dir.mkdir(parents=True)
+                lines = []
+                for i in range(3):
+                    f_id = f"{speaker}-{chapter}-{i:04d}"
+                    torchaudio.save(str(chapter_dir / f"{f_id}.flac"), torch.zeros(1, 1600 * (i + 1)), 16000)
+                    lines.append(f"{f_id} TEXT {i}")
+                (chapter_dir / f"{speaker}-{chapter}.trans.txt").write_text("\n".join(lines) + "\n")
+            index_path = Path(data_dir) / "dev-clean_index.json"
+
+            def build_index(**kwargs):
+                with self.assertLogs("hw_asr.datasets.librispeech_dataset", level="INFO") as logs:
+                    LibrispeechDataset(
+                        "dev-clean", data_dir=data_dir, text_encoder=text_encoder, config_parser=config_parser,
+                        **kwargs
+                    )
+                with index_path.open() as f:
+                    return json.load(f), " ".join(logs.output)
+
+            index, log = build_index(index_workers=1)
+            self.assertIn("6 of them were probed", log)
+            paths = [entry["path"] for entry in index]
+            self.assertEqual(paths, sorted(paths))
+            # the order doesn't depend on the number of workers
+            index, log = build_index(index_workers=3, rebuild_index=True)
+            self.assertEqual([entry["path"] for entry in index], paths)
+            self.assertIn("0 of them were probed", log)
+
+            # only touched files are probed again, other entries are taken from the previous index
+            for entry in index:
+                entry["audio_len"] = -1.0
+            with index_path.open("w") as f:
+                json.dump(index, f)
+            touched = Path(paths[1])
+            torchaudio.save(str(touched), torch.zeros(1, 8000), 16000)
+            index, log = build_index(index_workers=3, rebuild_index=True)
+            self.assertIn("1 of them were probed", log)
+            self.assertEqual([entry["path"] for entry in index], paths)
+            for entry in index:
+                self.assertEqual(entry["audio_len"], 0.5 if entry["path"] == str(touched) else -1.0)
+
+    def test_pack_librispeech_archive(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        config_parser = ConfigParser.get_default_configs()
+
+        audio_dir = ROOT_PATH / "test_data" / "audio"
+        transc_dir = ROOT_PATH / "test_data" / "transcriptions"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = Path(tmp_dir) / "dev-clean.tar.gz"
+            chapter_dir = "LibriSpeech/dev-clean/84/121550"
+            transcriptions = "".join(
+                f"{path.stem} {path.read_text().strip().upper()}\n" for path in sorted(transc_dir.iterdir())
+            ).encode()
+            with tarfile.open(str(archive_path), "w:gz") as archive:
+                for path in sorted(audio_dir.iterdir()):
+                    archive.add(str(path), f"{chapter_dir}/{path.name}")
+                # transcriptions come after the audio they describe
+                info = tarfile.TarInfo(f"{chapter_dir}/84-121550.trans.txt")
+                info.size = len(transcriptions)
+                archive.addfile(info, io.BytesIO(transcriptions))
+
+            shards_dir = Path(tmp_dir) / "packed"
+            pack_librispeech_archive(archive_path, shards_dir, max_shard_bytes=200000)
+            ds = PackedAudioDataset(shards_dir, text_encoder=text_encoder, config_parser=config_parser)
+            self.assertEqual(len(ds), 5)
+            for i in range(len(ds)):
+                item = ds[i]
+                name = Path(item["audio_path"]).stem
+                self.assertEqual(item["text"], (transc_dir / f"{name}.txt").read_text().strip().lower())
+                wave, _ = torchaudio.load(str(audio_dir / f"{name}.flac"))
+                self.assertEqual(item["audio"].shape, wave.shape)
+                self.assertTrue((item["audio"] - wave).abs().max() < 1e-4)
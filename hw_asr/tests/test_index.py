@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from hw_asr.storage.columnar_index import ColumnarIndex
+
+
+class TestIndex(unittest.TestCase):
+    def test_columnar_index(self):
+        records = [
+            {"path": f"/audio/{i}.flac", "text": "Héllo, World! " * (i % 5), "audio_len": i % 7 + 0.5}
+            for i in range(100)
+        ]
+        index = ColumnarIndex.from_records(records)
+        self.assertEqual([record.to_dict() for record in index], records)
+
+        indices = np.random.permutation(len(records))[:30]
+        taken = index.take(indices)
+        self.assertEqual([record.to_dict() for record in taken], [records[i] for i in indices])
+
+        joined = ColumnarIndex.concat([index, taken])
+        self.assertEqual(
+            [record.to_dict() for record in joined], records + [records[i] for i in indices]
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index_path = Path(tmp_dir) / "index.npz"
+            joined.save(index_path)
+            loaded = ColumnarIndex.load(index_path)
+            self.assertEqual(
+                [record.to_dict() for record in loaded], [record.to_dict() for record in joined]
+            )
+        self.assertEqual(index[-1]["text"], records[-1]["text"])
+
+        lengths = np.arange(len(records)) % 4
+        ragged_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=ragged_offsets[1:])
+        index.add_ragged_column("codes", ragged_offsets, np.repeat(np.arange(len(records)), lengths).astype(np.int8))
+        taken = ColumnarIndex.concat([index, index]).take(indices)
+        for record, i in zip(taken, indices):
+            self.assertEqual(record["codes"].tolist(), [i] * lengths[i])
+        self.assertIsNone(index[0].get("speaker"))
+        with self.assertRaises(IndexError):
+            _ = index[len(records)]
+
@@ -1,7 +1,40 @@
+import itertools
+import math
+import tempfile
 import unittest
+from pathlib import Path
+
+import numpy as np
 import torch
 
+from hw_asr.base.base_text_encoder import BaseTextEncoder
+from hw_asr.storage.columnar_index import pack_strings
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+from hw_asr.text_encoder.lexicon import NO_NODE, LexiconTrie
+from hw_asr.text_encoder.ngram_lm import NGramLM
+from hw_asr.text_encoder.prefix_beam_search import ctc_prefix_beam_search
+
+ARPA = """
+\\data\\
+ngram 1=6
+ngram 2=4
+
+\\1-grams:
+-1.0 <s> -0.5
+-1.0 </s>
+-0.7 i -0.3
+-1.2 wish -0.2
+-2.0 fish -0.2
+-3.0 <unk>
+
+\\2-grams:
+-0.1 <s> i
+-0.2 i wish
+-0.3 wish </s>
+-0.4 fish </s>
+
+\\end\\
+"""
 
 
 class TestTextEncoder(unittest.TestCase):
@@ -13,6 +46,147 @@ class TestTextEncoder(unittest.TestCase):
         decoded_text = text_encoder.ctc_decode(inds)
         self.assertIn(decoded_text, true_text)
 
+    def test_ctc_decode_batch(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        torch.manual_seed(0)
+        # long runs of repeats and blanks, as in real model outputs
+        argmax = torch.randint(0, len(text_encoder), (8, 50)).repeat_interleave(3, dim=1)
+        argmax[argmax > 20] = 0
+        lengths = torch.tensor([150, 149, 100, 1, 0, 77, 150, 3])
+        decoded = text_encoder.ctc_decode_batch(argmax, lengths)
+        for i in range(len(argmax)):
+            self.assertEqual(decoded[i], text_encoder.ctc_decode(argmax[i, :lengths[i]]))
+        self.assertEqual(text_encoder.ctc_decode_batch(torch.zeros(2, 5, dtype=torch.long)), ["", ""])
+
+    def test_encode_batch(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        texts = ["", "Hello, World!", "i wish i started doing this hw earlier", "Ça va? 42"]
+        offsets, codes = text_encoder.encode_batch(texts)
+        self.assertEqual(codes.dtype, np.int8)
+        for i, text in enumerate(texts):
+            self.assertEqual(
+                codes[offsets[i]: offsets[i + 1]].tolist(),
+                text_encoder.encode(text).reshape(-1).int().tolist()
+            )
+        with self.assertRaises(Exception):
+            CTCCharTextEncoder(list("abc")).encode_batch(["abd"])
+        # the generic per text path stores the same int8 column
+        generic_offsets, generic_codes = BaseTextEncoder.encode_packed(text_encoder, *pack_strings(texts))
+        self.assertEqual(generic_codes.dtype, np.int8)
+        self.assertEqual(generic_offsets.tolist(), offsets.tolist())
+        self.assertEqual(generic_codes.tolist(), codes.tolist())
+
     def test_beam_search(self):
         # TODO: (optional) write tests for beam search
         pass
+
+    def test_prefix_beam_search(self):
+        torch.manual_seed(0)
+        for _ in range(3):
+            log_probs = torch.randn(5, 3).mul(2).log_softmax(-1).numpy().astype(np.float64)
+            # exact probabilities of all label sequences by summing over every alignment
+            expected = {}
+            for path in itertools.product(range(3), repeat=5):
+                labels = tuple(t for t, _ in itertools.groupby(path) if t != 0)
+                expected[labels] = np.logaddexp(
+                    expected.get(labels, -np.inf), log_probs[np.arange(5), list(path)].sum()
+                )
+            beams = {tuple(tokens): score for tokens, score in ctc_prefix_beam_search(log_probs, beam_size=1000)}
+            self.assertEqual(beams.keys(), expected.keys())
+            for labels, score in expected.items():
+                self.assertAlmostEqual(beams[labels], score)
+
+        # pruning keeps the best hypothesis of a peaky output
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        text = "i^^ ^w^i^sss^hhh^   i ^^^s^t^aaaar^teee^d dddddd^oooo^in^g"
+        log_probs = torch.nn.functional.one_hot(
+            torch.tensor([text_encoder.char2ind[c] for c in text]), len(text_encoder)
+        ).float().mul(8).add(torch.randn(len(text), len(text_encoder))).log_softmax(-1)
+        hypos = text_encoder.ctc_prefix_beam_search(
+            log_probs, len(text), beam_size=10, top_k=5, cutoff_prob=0.999, blank_skip_threshold=0.99
+        )
+        self.assertEqual(hypos[0], text_encoder.ctc_decode(log_probs.argmax(-1)))
+        self.assertEqual(hypos[0], text_encoder.decoder.decode(log_probs.numpy(), beam_width=10))
+
+    def test_lm_fusion(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            arpa_path = Path(tmp_dir) / "lm.arpa"
+            arpa_path.write_text(ARPA)
+            lm = NGramLM(arpa_path)
+        self.assertEqual(lm.order, 2)
+        # scores are stored as float32
+        self.assertAlmostEqual(lm.score(("<s>", "i"), "wish"), -0.2 * math.log(10), places=5)
+        # backoff of "i" + unigram "fish", unknown words back off to <unk>
+        self.assertAlmostEqual(lm.score(("<s>", "i"), "fish"), -2.3 * math.log(10), places=5)
+        self.assertAlmostEqual(lm.score(("wish",), "zzz"), -3.2 * math.log(10), places=5)
+
+        # vocabularies are normalized like transcripts, special tokens are kept
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            arpa_path = Path(tmp_dir) / "upper.arpa"
+            arpa_path.write_text(
+                ARPA.replace(" i", " I").replace("wish", "WISH").replace("fish", "FISH'").replace("<unk>", "<UNK>")
+            )
+            upper_lm = NGramLM(arpa_path)
+        for history, word in [(("<s>", "i"), "wish"), (("<s>", "i"), "fish"), (("wish",), "zzz"), (("wish",), "</s>")]:
+            self.assertAlmostEqual(upper_lm.score(history, word), lm.score(history, word), places=5)
+
+        # acoustics slightly prefer "i fish", the language model prefers "i wish"
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        text = "i^ ^^wish"
+        logits = torch.nn.functional.one_hot(
+            torch.tensor([text_encoder.char2ind[c] for c in text]), len(text_encoder)
+        ).float().mul(6)
+        logits[5, text_encoder.char2ind["f"]] = 6.5
+        log_probs = logits.log_softmax(-1)
+        self.assertEqual(text_encoder.ctc_prefix_beam_search(log_probs, len(text), beam_size=20)[0], "i fish")
+        text_encoder.set_language_model(lm, alpha=1.0, beta=0.5)
+        self.assertEqual(text_encoder.ctc_prefix_beam_search(log_probs, len(text), beam_size=20)[0], "i wish")
+
+    def test_lexicon(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        lexicon = LexiconTrie(["i", "wish", "Fish", "fist", "42"], text_encoder.labels)
+        self.assertEqual(lexicon.n_nodes, 1 + 1 + 4 + 4 + 1)
+        f, w, z = (text_encoder.char2ind[c] for c in "fwz")
+        children = lexicon.children(np.array([0, 0, 0]), np.array([f, w, z]))
+        self.assertEqual(children[2], NO_NODE)
+        node = children[0]
+        for char in "ish":
+            node = lexicon.children(np.array([node]), np.array([text_encoder.char2ind[char]]))[0]
+        self.assertTrue(lexicon.is_word[node])
+        self.assertFalse(lexicon.is_word[children[0]])
+        empty = LexiconTrie(["42", "!!"], text_encoder.labels)
+        self.assertEqual(empty.children(np.array([0, 0]), np.array([f, w])).tolist(), [NO_NODE, NO_NODE])
+
+        # acoustics prefer "i wizh", which is not a word
+        text = "i^ ^^wissh^^ ^sstarrted"
+        logits = torch.nn.functional.one_hot(
+            torch.tensor([text_encoder.char2ind[c] for c in text]), len(text_encoder)
+        ).float().mul(6)
+        logits[7, z] = 6.5
+        log_probs = logits.log_softmax(-1)
+        self.assertEqual(text_encoder.ctc_prefix_beam_search(log_probs, len(text), beam_size=20)[0],
+                         "i wizsh started")
+        # "started" is out of vocabulary, it's kept only with the fallback
+        text_encoder.set_lexicon(lexicon, oov_penalty=-3.0)
+        self.assertEqual(text_encoder.ctc_prefix_beam_search(log_probs, len(text), beam_size=20)[0],
+                         "i wish started")
+        text_encoder.set_lexicon(["i", "wish", "started"], oov_penalty=None)
+        self.assertEqual(text_encoder.ctc_prefix_beam_search(log_probs, len(text), beam_size=20)[0],
+                         "i wish started")
+        text_encoder.set_lexicon(lexicon, oov_penalty=None)
+        for hypo in text_encoder.ctc_prefix_beam_search(log_probs, len(text), beam_size=20):
+            self.assertTrue(set(hypo.split()) <= {"i", "wish", "fish", "fist"}, hypo)
+
+    def test_beam_search_batch(self):
+        text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+        torch.manual_seed(0)
+        log_probs = torch.randn(4, 30, len(text_encoder)).mul(3).log_softmax(-1)
+        lengths = torch.tensor([30, 12, 1, 25])
+        text_encoder.get_beam_search_pool(2)
+        try:
+            futures = text_encoder.ctc_beam_search_batch(log_probs, lengths, beam_size=10, n_hypos=3)
+            for i, future in enumerate(futures):
+                beams = text_encoder.decoder.decode_beams(log_probs[i, :lengths[i]].numpy(), beam_width=10)
+                self.assertEqual(future.result(), [beam[0] for beam in beams[:3]])
+        finally:
+            text_encoder.close()
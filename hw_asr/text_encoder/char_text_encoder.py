@@ -1,12 +1,17 @@
 import json
 from pathlib import Path
 from string import ascii_lowercase
-from typing import List, Union
+from typing import List, Tuple, Union
 
 import numpy as np
 from torch import Tensor
 
-from hw_asr.base.base_text_encoder import BaseTextEncoder
+from hw_asr.base.base_text_encoder import BaseTextEncoder, NORMALIZED_BYTES
+from hw_asr.storage.columnar_index import pack_strings
+
+# marks of the byte lookup table
+_DROPPED = -1
+_UNKNOWN = -2
 
 
 class CharTextEncoder(BaseTextEncoder):
@@ -14,6 +19,7 @@ class CharTextEncoder(BaseTextEncoder):
     def __init__(self, alphabet: List[str]):
         self.ind2char = {k: v for k, v in enumerate(sorted(alphabet))}
         self.char2ind = {v: k for k, v in self.ind2char.items()}
+        self._byte_lut = None
 
     def __len__(self):
         return len(self.ind2char)
@@ -31,6 +37,41 @@ class CharTextEncoder(BaseTextEncoder):
             raise Exception(
                 f"Can't encode text '{text}'. Unknown chars: '{' '.join(unknown_chars)}'")
 
+    def _get_byte_lut(self) -> np.ndarray:
+        # utf-8 byte -> token index of the normalized char. Built lazily, since
+        # subclasses change the alphabet after __init__
+        if self._byte_lut is None:
+            assert len(self.char2ind) <= 128, "Token indices are stored as int8"
+            lut = np.full(256, _DROPPED, dtype=np.int16)
+            for byte in np.flatnonzero(NORMALIZED_BYTES):
+                lut[byte] = self.char2ind.get(chr(byte).lower(), _UNKNOWN)
+            self._byte_lut = lut
+        return self._byte_lut
+
+    def encode_packed(self, offsets: np.ndarray, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized `encode` of utf-8 texts packed into one byte array with offsets:
+        normalization and encoding are a single byte lookup table pass.
+        Returns offsets and packed int8 token indices.
+        """
+        codes = self._get_byte_lut()[data]
+        if (codes == _UNKNOWN).any():
+            text_ind = np.searchsorted(offsets, np.flatnonzero(codes == _UNKNOWN)[0], side="right") - 1
+            text = self.normalize_text(data[offsets[text_ind]: offsets[text_ind + 1]].tobytes().decode("utf-8"))
+            unknown_chars = set([char for char in text if char not in self.char2ind])
+            raise Exception(
+                f"Can't encode text '{text}'. Unknown chars: '{' '.join(unknown_chars)}'")
+        kept = codes != _DROPPED
+        kept_before = np.zeros(len(data) + 1, dtype=np.int64)
+        np.cumsum(kept, out=kept_before[1:])
+        return kept_before[offsets], codes[kept].astype(np.int8)
+
+    def encode_batch(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encodes a list of texts at once, see `encode_packed`
+        """
+        return self.encode_packed(*pack_strings(texts))
+
     def decode(self, vector: Union[Tensor, np.ndarray, List[int]]):
         return ''.join([self.ind2char[int(ind)] for ind in vector]).strip()
 
@@ -1,13 +1,45 @@
-from typing import List, Tuple
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 
 from hw_asr.text_encoder.char_text_encoder import CharTextEncoder
+from hw_asr.text_encoder.lexicon import LexiconTrie
+from hw_asr.text_encoder.ngram_lm import NGramLM
+from hw_asr.text_encoder.prefix_beam_search import LexiconConstraint, ShallowFusion, ctc_prefix_beam_search
 
 from itertools import groupby
 
 from pyctcdecode import build_ctcdecoder
 
+# decoder of a beam search pool process, built once by the pool initializer
+_worker_decoder = None
+_worker_labels = None
+_worker_fusion = None
+_worker_lexicon = None
+
+
+def _init_beam_search_worker(labels: List[str], fusion: Optional[ShallowFusion],
+                             lexicon: Optional[LexiconConstraint]):
+    global _worker_decoder, _worker_labels, _worker_fusion, _worker_lexicon
+    _worker_decoder = build_ctcdecoder(labels)
+    _worker_labels = labels
+    _worker_fusion = fusion
+    _worker_lexicon = lexicon
+
+
+def _beam_search_worker(log_probs: np.ndarray, beam_size: int, n_hypos: int) -> List[str]:
+    if _worker_fusion is None and _worker_lexicon is None:
+        beams = _worker_decoder.decode_beams(log_probs, beam_width=beam_size)
+        return [beam[0] for beam in beams[:n_hypos]]
+    # with a language model or a lexicon the native search is used
+    beams = ctc_prefix_beam_search(log_probs, beam_size=beam_size, fusion=_worker_fusion, lexicon=_worker_lexicon)
+    return ["".join(_worker_labels[token] for token in tokens) for tokens, _ in beams[:n_hypos]]
+
 
 class CTCCharTextEncoder(CharTextEncoder):
     EMPTY_TOK = "^"
@@ -23,11 +55,51 @@ class CTCCharTextEncoder(CharTextEncoder):
         self.labels = list(self.char2ind.keys())
         self.labels[0] = ""  # for decoder empty token should be empty
         self.decoder = build_ctcdecoder(self.labels)
+        self._token_lut = None
+        self._beam_search_pool = None
+        self.fusion = None
+        self.lexicon = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_beam_search_pool"] = None
+        return state
 
-    def ctc_decode(self, inds: torch.tensor) -> str:
-        token_inds = inds.tolist()
+    def ctc_decode(self, inds: Union[torch.Tensor, List[int]]) -> str:
+        token_inds = inds.tolist() if isinstance(inds, torch.Tensor) else list(inds)
         return "".join([c for c in [self.ind2char[t] for t, _ in groupby(token_inds)] if c != self.EMPTY_TOK])
 
+    def _get_token_lut(self) -> Tuple[np.ndarray, np.ndarray]:
+        # token index -> its string and the string length, the empty token maps to ""
+        if self._token_lut is None:
+            chars = [self.ind2char[i] if self.ind2char[i] != self.EMPTY_TOK else "" for i in range(len(self))]
+            self._token_lut = np.array(chars, dtype=object), np.array([len(c) for c in chars], dtype=np.int64)
+        return self._token_lut
+
+    def ctc_decode_batch(self, argmax: torch.Tensor, lengths: Optional[torch.Tensor] = None) -> List[str]:
+        """
+        Vectorized `ctc_decode` of a (batch, time) tensor of argmax token indices.
+        Repeats are collapsed and blanks dropped with a mask over the whole batch,
+        surviving tokens become strings through one lookup and a single join.
+
+        :param lengths: valid length of every row, frames past it are ignored
+        """
+        argmax = argmax.detach().cpu()
+        keep = argmax != self.char2ind[self.EMPTY_TOK]
+        keep[:, 1:] &= argmax[:, 1:] != argmax[:, :-1]
+        if lengths is not None:
+            keep &= torch.arange(argmax.shape[1]) < torch.as_tensor(lengths).cpu()[:, None]
+        tokens = argmax[keep].numpy()
+        token_chars, token_lengths = self._get_token_lut()
+        text = "".join(token_chars[tokens].tolist())
+        # char offsets of the rows in the joined text
+        chars_before = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(token_lengths[tokens], out=chars_before[1:])
+        tokens_before = np.zeros(len(argmax) + 1, dtype=np.int64)
+        np.cumsum(keep.sum(dim=1).numpy(), out=tokens_before[1:])
+        offsets = chars_before[tokens_before]
+        return [text[offsets[i]: offsets[i + 1]] for i in range(len(argmax))]
+
     def ctc_beam_search(self, probs: torch.tensor, probs_length,
                         beam_size: int = 100) -> List[str]:
         """
@@ -39,3 +111,87 @@ class CTCCharTextEncoder(CharTextEncoder):
         beams = self.decoder.decode_beams(probs[:probs_length].numpy(), beam_width=beam_size)
         hypos = [beams[i][0] for i in range(len(beams[:10]))]
         return hypos
+
+    def set_language_model(self, lm: Union[NGramLM, str, Path, None], alpha: float = 0.5, beta: float = 1.0):
+        """
+        Word n-gram LM (or path to an ARPA file) fused into `ctc_prefix_beam_search` and
+        `ctc_beam_search_batch` with weight `alpha` and word insertion bonus `beta`, None removes it
+        """
+        if lm is not None and not isinstance(lm, NGramLM):
+            lm = NGramLM(lm)
+        self.fusion = ShallowFusion(lm, self.labels, alpha, beta) if lm is not None else None
+        # pool workers have a copy of the old model
+        self.close()
+
+    def set_lexicon(self, lexicon: Union[LexiconTrie, str, Path, Iterable[str], None],
+                    oov_penalty: Optional[float] = -10.0):
+        """
+        Lexicon (a trie, a file with one word per line or a list of words) the words of
+        `ctc_prefix_beam_search` and `ctc_beam_search_batch` hypotheses are restricted to.
+        Out of vocabulary words cost `oov_penalty` each, with None they are not allowed.
+        None removes the lexicon.
+        """
+        if isinstance(lexicon, (str, Path)):
+            lexicon = LexiconTrie.from_file(lexicon, self.labels)
+        elif lexicon is not None and not isinstance(lexicon, LexiconTrie):
+            lexicon = LexiconTrie(lexicon, self.labels)
+        self.lexicon = LexiconConstraint(lexicon, self.labels, oov_penalty) if lexicon is not None else None
+        # pool workers have a copy of the old lexicon
+        self.close()
+
+    def ctc_prefix_beam_search(self, log_probs: torch.Tensor, log_probs_length, beam_size: int = 100,
+                               top_k: Optional[int] = None, cutoff_prob: float = 1.0,
+                               blank_skip_threshold: Optional[float] = None) -> List[str]:
+        """
+        Native prefix beam search (see `prefix_beam_search.ctc_prefix_beam_search`) of (time, voc) log-probs,
+        returns the 10 best hypotheses. The language model set with `set_language_model` is fused in
+        and words are restricted to the lexicon set with `set_lexicon`.
+        """
+        assert len(log_probs.shape) == 2 and log_probs.shape[-1] == len(self.ind2char)
+        beams = ctc_prefix_beam_search(
+            log_probs[:int(log_probs_length)].detach().cpu().numpy(), beam_size=beam_size,
+            blank=self.char2ind[self.EMPTY_TOK], top_k=top_k, cutoff_prob=cutoff_prob,
+            blank_skip_threshold=blank_skip_threshold, fusion=self.fusion, lexicon=self.lexicon,
+        )
+        token_chars, _ = self._get_token_lut()
+        return ["".join(token_chars[tokens].tolist()) for tokens, _ in beams[:10]]
+
+    def get_beam_search_pool(self, n_workers: Optional[int] = None) -> ProcessPoolExecutor:
+        """
+        Process pool of `ctc_beam_search_batch`. It is started on first use and stays alive,
+        every worker builds its decoder once. Without a language model and a lexicon workers run
+        pyctcdecode, otherwise the native prefix beam search. Processes are spawned, so the pool is safe to use
+        after CUDA is initialized.
+        """
+        if self._beam_search_pool is None:
+            self._beam_search_pool = ProcessPoolExecutor(
+                max_workers=n_workers if n_workers is not None else os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_beam_search_worker,
+                initargs=(self.labels, self.fusion, self.lexicon),
+            )
+        return self._beam_search_pool
+
+    def ctc_beam_search_batch(self, log_probs: torch.Tensor, log_probs_length: torch.Tensor,
+                              beam_size: int = 100, n_hypos: int = 10) -> List[Future]:
+        """
+        Submits beam search of every record of a (batch, time, voc) log-probs tensor to the pool
+        and returns right away, so decoding runs while the next batch goes through the model.
+
+        :return: one future per record, its result is a list of `n_hypos` best hypotheses
+        """
+        assert len(log_probs.shape) == 3 and log_probs.shape[-1] == len(self.ind2char)
+        pool = self.get_beam_search_pool()
+        log_probs = log_probs.detach().float().cpu().numpy()
+        return [
+            pool.submit(_beam_search_worker, log_probs[i, :int(length)], beam_size, n_hypos)
+            for i, length in enumerate(log_probs_length)
+        ]
+
+    def close(self):
+        """
+        Stops the beam search pool
+        """
+        if self._beam_search_pool is not None:
+            self._beam_search_pool.shutdown()
+            self._beam_search_pool = None
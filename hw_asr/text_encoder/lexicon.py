@@ -0,0 +1,75 @@
+import logging
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+from hw_asr.base.base_text_encoder import BaseTextEncoder
+
+logger = logging.getLogger(__name__)
+
+NO_NODE = -1
+ROOT = 0
+
+
+class LexiconTrie:
+    """
+    Character prefix trie of a word list over token indices, built once.
+
+    Edges are stored as a sorted array of `node * voc_size + token` keys with the child of
+    every edge, so the trie takes a few bytes per character and children of many
+    (node, token) pairs are found with one `searchsorted`.
+    """
+
+    def __init__(self, words: Iterable[str], labels: List[str]):
+        self.voc_size = len(labels)
+        char2ind = {label: ind for ind, label in enumerate(labels) if len(label) > 0}
+        edges = {}
+        word_ends = set()
+        n_words = 0
+        n_skipped = 0
+        for word in words:
+            word = BaseTextEncoder.normalize_text(word).strip()
+            if len(word) == 0:
+                continue
+            if any(char not in char2ind or char == " " for char in word):
+                n_skipped += 1
+                continue
+            node = ROOT
+            for char in word:
+                node = edges.setdefault((node, char2ind[char]), len(edges) + 1)
+            word_ends.add(node)
+            n_words += 1
+        if n_skipped > 0:
+            logger.warning(f"{n_skipped} words of the lexicon have chars out of the alphabet and are skipped")
+        if n_words == 0:
+            logger.warning("The lexicon is empty, every word is out of vocabulary")
+
+        self.n_nodes = len(edges) + 1
+        keys = np.array([node * self.voc_size + token for node, token in edges.keys()], dtype=np.int64)
+        order = np.argsort(keys)
+        self.edge_keys = keys[order]
+        self.edge_children = np.array(list(edges.values()), dtype=np.int32)[order]
+        self.is_word = np.zeros(self.n_nodes, dtype=bool)
+        self.is_word[list(word_ends)] = True
+        logger.info(f"Lexicon trie: {n_words} words, {self.n_nodes} nodes")
+
+    @classmethod
+    def from_file(cls, path, labels: List[str]) -> "LexiconTrie":
+        """
+        Lexicon of a text file with one word per line (anything after the word is ignored)
+        """
+        with Path(path).open(encoding="utf-8") as f:
+            return cls((line.split()[0] for line in f if len(line.split()) > 0), labels)
+
+    def children(self, nodes: np.ndarray, tokens: np.ndarray) -> np.ndarray:
+        """
+        Children of `nodes` by `tokens`, NO_NODE where there is no such edge
+        """
+        if len(self.edge_keys) == 0:
+            # empty lexicon, e.g. all of its words are out of the alphabet
+            return np.full(np.broadcast(nodes, tokens).shape, NO_NODE, dtype=self.edge_children.dtype)
+        keys = nodes.astype(np.int64) * self.voc_size + tokens
+        positions = np.minimum(np.searchsorted(self.edge_keys, keys), len(self.edge_keys) - 1)
+        found = self.edge_keys[positions] == keys
+        return np.where(found, self.edge_children[positions], NO_NODE)
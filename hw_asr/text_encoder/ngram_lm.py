@@ -0,0 +1,176 @@
+import logging
+import math
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hw_asr.base.base_text_encoder import BaseTextEncoder
+
+logger = logging.getLogger(__name__)
+
+BOS = "<s>"
+EOS = "</s>"
+UNK = "<unk>"
+
+# ARPA files store log10 probabilities, scores are natural logs like acoustic log-probs
+_LOG_10 = math.log(10)
+
+# FNV-1a style hash of word id tuples, computed the same way for one tuple and for arrays of them
+_FNV_OFFSET = 0xcbf29ce484222325
+_FNV_PRIME = 0x100000001b3
+_MASK = (1 << 64) - 1
+
+
+def _hash_ngram(ids: Tuple[int, ...]) -> int:
+    h = _FNV_OFFSET ^ len(ids)
+    for word_id in ids:
+        h = ((h ^ (word_id + 1)) * _FNV_PRIME) & _MASK
+    return h
+
+
+def _hash_ngrams(ids: np.ndarray) -> np.ndarray:
+    """
+    Hashes of (n, order) word ids, same as `_hash_ngram` of every row
+    """
+    h = np.full(len(ids), _FNV_OFFSET ^ ids.shape[1], dtype=np.uint64)
+    for col in range(ids.shape[1]):
+        h = (h ^ (ids[:, col].astype(np.uint64) + np.uint64(1))) * np.uint64(_FNV_PRIME)
+    return h
+
+
+class NGramLM:
+    """
+    Word n-gram language model read from an ARPA file.
+
+    Words are normalized like transcripts (so models with uppercase vocabularies match
+    lowercase hypotheses) and mapped to ints. N-grams of all orders are stored as a sorted
+    array of 64-bit hashes of their word ids with float32 log-probs and backoffs, 16 bytes
+    per n-gram, and are found with `searchsorted`. Probabilities of unseen n-grams are
+    computed with backoff. States (the part of a word history the model can use) and
+    scores are memoized in LRU caches, beams share most of their histories.
+    """
+
+    def __init__(self, arpa_path, cache_size: int = 1 << 16, unk_logp: float = -10.0 * _LOG_10):
+        self.vocab: Dict[str, int] = {}
+        self.order = 0
+        self._load(arpa_path)
+        # without <unk> in the model out of vocabulary words get `unk_logp`
+        self.unk_logp = unk_logp
+        self._unk_id = self.vocab.get(UNK)
+        self.cache_size = cache_size
+        self._init_caches()
+        logger.info(f"Loaded {self.order}-gram LM from {arpa_path}: {len(self.vocab)} words, "
+                    f"{len(self._keys)} n-grams")
+
+    @staticmethod
+    def _normalize_word(word: str) -> str:
+        if word.lower() in (BOS, EOS, UNK):
+            return word.lower()
+        return BaseTextEncoder.normalize_text(word).strip()
+
+    def _word_id(self, word: str) -> int:
+        if word not in self.vocab:
+            self.vocab[word] = len(self.vocab)
+        return self.vocab[word]
+
+    def _load(self, arpa_path):
+        order = None
+        # order -> word ids, log-probs and backoffs of its n-grams
+        ngram_ids: Dict[int, List[Tuple[int, ...]]] = {}
+        ngram_values: Dict[int, List[Tuple[float, float]]] = {}
+        n_skipped = 0
+        with Path(arpa_path).open(encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0 or line == "\\data\\" or line.startswith("ngram "):
+                    continue
+                if line == "\\end\\":
+                    break
+                if line.startswith("\\") and line.endswith("-grams:"):
+                    order = int(line[1:-len("-grams:")])
+                    self.order = max(self.order, order)
+                    ngram_ids.setdefault(order, [])
+                    ngram_values.setdefault(order, [])
+                    continue
+                assert order is not None, f"Unexpected line before n-gram sections of {arpa_path}: {line}"
+                parts = line.split()
+                words = [self._normalize_word(word) for word in parts[1: 1 + order]]
+                if any(len(word) == 0 for word in words):
+                    # no letters at all, such words never appear in hypotheses
+                    n_skipped += 1
+                    continue
+                backoff = float(parts[1 + order]) if len(parts) > 1 + order else 0.0
+                ngram_ids[order].append(tuple(self._word_id(word) for word in words))
+                ngram_values[order].append((float(parts[0]), backoff))
+        assert self.order > 0, f"No n-grams found in {arpa_path}"
+        if n_skipped > 0:
+            logger.warning(f"{n_skipped} n-grams of {arpa_path} have words without letters and are skipped")
+
+        keys = np.concatenate([
+            _hash_ngrams(np.array(ngram_ids[n], dtype=np.int64).reshape(-1, n)) for n in sorted(ngram_ids)
+        ])
+        values = np.concatenate([
+            np.array(ngram_values[n], dtype=np.float64).reshape(-1, 2) for n in sorted(ngram_values)
+        ]) * _LOG_10
+        # words that differ only in case or punctuation are merged, the first n-gram is kept
+        self._keys, first = np.unique(keys, return_index=True)
+        self._logp = values[first, 0].astype(np.float32)
+        self._backoff = values[first, 1].astype(np.float32)
+
+    def _find(self, ids: Tuple[int, ...]) -> Optional[int]:
+        key = np.uint64(_hash_ngram(ids))
+        pos = int(np.searchsorted(self._keys, key))
+        if pos < len(self._keys) and self._keys[pos] == key:
+            return pos
+        return None
+
+    def _init_caches(self):
+        self._get_state = lru_cache(maxsize=self.cache_size)(self._state)
+        self._get_score = lru_cache(maxsize=self.cache_size)(self._score)
+
+    def __getstate__(self):
+        # caches are per process
+        state = self.__dict__.copy()
+        del state["_get_state"], state["_get_score"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_caches()
+
+    def _state(self, history: Tuple[str, ...]) -> Tuple[int, ...]:
+        # the longest suffix of the history (at most order - 1 words) that is an n-gram of the model
+        ids = tuple(self.vocab.get(word, self._unk_id) for word in history[max(0, len(history) - self.order + 1):])
+        while len(ids) > 0 and (None in ids or self._find(ids) is None):
+            ids = ids[1:]
+        return ids
+
+    def _score(self, state: Tuple[int, ...], word: str) -> float:
+        word_id = self.vocab.get(word, self._unk_id)
+        if word_id is None:
+            return self.unk_logp
+        logp = 0.0
+        while True:
+            pos = self._find(state + (word_id,))
+            if pos is not None:
+                return logp + float(self._logp[pos])
+            if len(state) == 0:
+                return logp + self.unk_logp
+            context = self._find(state)
+            if context is not None:
+                logp += float(self._backoff[context])
+            state = state[1:]
+
+    def score(self, history: Tuple[str, ...], word: str) -> float:
+        """
+        Natural log-probability of `word` following the words of `history`
+        """
+        return self._get_score(self._get_state(history), word)
+
+    def initial_history(self) -> Tuple[str, ...]:
+        return (BOS,)
+
+    def end_score(self, history: Tuple[str, ...]) -> float:
+        return self.score(history, EOS)
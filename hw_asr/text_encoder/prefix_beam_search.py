@@ -0,0 +1,340 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hw_asr.text_encoder.lexicon import NO_NODE, ROOT as LEXICON_ROOT, LexiconTrie
+from hw_asr.text_encoder.ngram_lm import NGramLM
+
+_NO_NODE = -1
+_ROOT = 0
+
+
+class _PrefixTrie:
+    """
+    Prefixes of all beams stored as a trie in flat arrays: node -> parent, node -> last token
+    and a (node, token) -> child table. A prefix is identified by its node id, so beams
+    with equal prefixes are merged by comparing ints and extending a beam is an array lookup.
+    """
+
+    def __init__(self, voc_size: int, capacity: int = 1024):
+        self.children = np.full((capacity, voc_size), _NO_NODE, dtype=np.int32)
+        self.parent = np.full(capacity, _NO_NODE, dtype=np.int32)
+        # the root (empty prefix) has no token, -1 never equals a token index
+        self.token = np.full(capacity, -1, dtype=np.int32)
+        self.n_nodes = 1
+
+    def _grow(self, n_nodes: int):
+        capacity = len(self.parent)
+        while capacity < n_nodes:
+            capacity *= 2
+        if capacity == len(self.parent):
+            return
+        n_old = len(self.parent)
+        self.children = np.concatenate(
+            [self.children, np.full((capacity - n_old, self.children.shape[1]), _NO_NODE, dtype=np.int32)]
+        )
+        self.parent = np.concatenate([self.parent, np.full(capacity - n_old, _NO_NODE, dtype=np.int32)])
+        self.token = np.concatenate([self.token, np.full(capacity - n_old, -1, dtype=np.int32)])
+
+    def extend(self, nodes: np.ndarray, tokens: np.ndarray) -> np.ndarray:
+        """
+        Children of `nodes` by `tokens` (arrays of equal shape), missing children are created.
+        (node, token) pairs must be unique.
+        """
+        children = self.children[nodes, tokens]
+        new = children == _NO_NODE
+        n_new = int(new.sum())
+        if n_new > 0:
+            self._grow(self.n_nodes + n_new)
+            new_ids = np.arange(self.n_nodes, self.n_nodes + n_new, dtype=np.int32)
+            self.children[nodes[new], tokens[new]] = new_ids
+            self.parent[new_ids] = nodes[new]
+            self.token[new_ids] = tokens[new]
+            children[new] = new_ids
+            self.n_nodes += n_new
+        return children
+
+    def get_tokens(self, node: int) -> List[int]:
+        tokens = []
+        while node != _ROOT:
+            tokens.append(int(self.token[node]))
+            node = self.parent[node]
+        return tokens[::-1]
+
+
+class ShallowFusion:
+    """
+    Word n-gram LM fusion for `ctc_prefix_beam_search`. A word is scored once the delimiter
+    after it is added to a prefix, the last word and the sentence end are scored after the
+    last frame. A prefix gets `alpha` * LM log-prob of its words + `beta` * number of its words.
+    """
+
+    def __init__(self, lm: NGramLM, labels: List[str], alpha: float = 0.5, beta: float = 1.0,
+                 delimiter: str = " "):
+        self.lm = lm
+        self.labels = labels
+        self.alpha = alpha
+        self.beta = beta
+        self.delimiter = labels.index(delimiter)
+
+    def start(self, trie: "_PrefixTrie") -> "_FusionState":
+        return _FusionState(self, trie)
+
+
+class _FusionState:
+    """
+    LM scores of the prefixes of one search. Every trie node keeps its score and the node
+    its last word starts at, word histories are kept for those word start nodes.
+    """
+
+    def __init__(self, fusion: ShallowFusion, trie: "_PrefixTrie"):
+        self.fusion = fusion
+        self.trie = trie
+        self.scores = np.zeros(len(trie.parent))
+        self.word_starts = np.zeros(len(trie.parent), dtype=np.int32)
+        self.histories: Dict[int, Tuple[str, ...]] = {_ROOT: fusion.lm.initial_history()}
+        # words completed by delimiter extensions scored in the current frame
+        self._completed: Dict[int, Tuple[str, float]] = {}
+
+    def _word(self, node: int) -> str:
+        # chars of the last (unfinished) word of a prefix
+        chars = []
+        word_start = self.word_starts[node]
+        while node != word_start:
+            chars.append(self.fusion.labels[self.trie.token[node]])
+            node = self.trie.parent[node]
+        return "".join(chars[::-1])
+
+    def _word_score(self, node: int) -> Tuple[str, float]:
+        # LM score of the last word of a prefix, nothing for an empty word (repeated delimiters)
+        word = self._word(node)
+        if len(word) == 0:
+            return word, 0.0
+        history = self.histories[self.word_starts[node]]
+        return word, self.fusion.alpha * self.fusion.lm.score(history, word) + self.fusion.beta
+
+    def extension_scores(self, parents: np.ndarray, tokens: np.ndarray) -> np.ndarray:
+        """
+        Scores of the prefixes `parents` extended by `tokens`
+        """
+        scores = self.scores[parents]
+        self._completed = {}
+        for i in np.flatnonzero(tokens == self.fusion.delimiter).tolist():
+            parent = int(parents[i])
+            self._completed[parent] = self._word_score(parent)
+            scores[i] += self._completed[parent][1]
+        return scores
+
+    def add(self, nodes: np.ndarray, parents: np.ndarray, tokens: np.ndarray, scores: np.ndarray):
+        """
+        Stores scores of the extensions kept in the current frame
+        """
+        if len(self.scores) < len(self.trie.parent):
+            n_new = len(self.trie.parent) - len(self.scores)
+            self.scores = np.concatenate([self.scores, np.zeros(n_new)])
+            self.word_starts = np.concatenate([self.word_starts, np.zeros(n_new, dtype=np.int32)])
+        is_delimiter = tokens == self.fusion.delimiter
+        self.scores[nodes] = scores
+        self.word_starts[nodes] = np.where(is_delimiter, nodes, self.word_starts[parents])
+        # the model only looks at the last order - 1 words
+        max_history = max(self.fusion.lm.order - 1, 1)
+        for node, parent in zip(nodes[is_delimiter].tolist(), parents[is_delimiter].tolist()):
+            history = self.histories[self.word_starts[parent]]
+            word, _ = self._completed[parent]
+            self.histories[node] = (history + (word,))[-max_history:] if len(word) > 0 else history
+
+    def final_scores(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Scores of complete hypotheses: the last word and the sentence end are scored
+        """
+        scores = self.scores[nodes].copy()
+        for i, node in enumerate(nodes.tolist()):
+            word, word_score = self._word_score(node)
+            history = self.histories[self.word_starts[node]]
+            if len(word) > 0:
+                history = history + (word,)
+            scores[i] += word_score + self.fusion.alpha * self.fusion.lm.end_score(history)
+        return scores
+
+
+class LexiconConstraint:
+    """
+    Restricts words of `ctc_prefix_beam_search` hypotheses to a lexicon. Every prefix follows
+    the lexicon trie char by char. A char without an edge (or a delimiter after an incomplete
+    word) makes the word out of vocabulary: with `oov_penalty` None such prefixes are dropped,
+    otherwise the word is finished unconstrained and costs `oov_penalty` once.
+    """
+
+    def __init__(self, lexicon: LexiconTrie, labels: List[str], oov_penalty: Optional[float] = -10.0,
+                 delimiter: str = " "):
+        self.lexicon = lexicon
+        self.oov_penalty = oov_penalty if oov_penalty is not None else -np.inf
+        self.delimiter = labels.index(delimiter)
+
+    def start(self, trie: "_PrefixTrie") -> "_LexiconState":
+        return _LexiconState(self, trie)
+
+
+class _LexiconState:
+    """
+    Lexicon trie node of the last word of every prefix of one search (NO_NODE for out
+    of vocabulary words) and the total OOV penalty of the prefix.
+    """
+
+    def __init__(self, constraint: LexiconConstraint, trie: "_PrefixTrie"):
+        self.constraint = constraint
+        self.trie = trie
+        self.scores = np.zeros(len(trie.parent))
+        self.lexicon_nodes = np.full(len(trie.parent), LEXICON_ROOT, dtype=np.int32)
+
+    def _incomplete(self, lexicon_nodes: np.ndarray) -> np.ndarray:
+        # words that are only a prefix of lexicon words
+        return (lexicon_nodes != NO_NODE) & (lexicon_nodes != LEXICON_ROOT) \
+            & ~self.constraint.lexicon.is_word[np.maximum(lexicon_nodes, 0)]
+
+    def _step(self, parents: np.ndarray, tokens: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # lexicon nodes of the extended prefixes and penalties of the words they leave the lexicon with
+        current = self.lexicon_nodes[parents]
+        is_delimiter = tokens == self.constraint.delimiter
+        in_lexicon = current != NO_NODE
+        following = np.full(len(parents), NO_NODE, dtype=np.int32)
+        following[is_delimiter] = LEXICON_ROOT
+        in_word = in_lexicon & ~is_delimiter
+        following[in_word] = self.constraint.lexicon.children(current[in_word], tokens[in_word])
+        leaves = (in_word & (following == NO_NODE)) | (is_delimiter & self._incomplete(current))
+        return following, np.where(leaves, self.constraint.oov_penalty, 0.0)
+
+    def extension_scores(self, parents: np.ndarray, tokens: np.ndarray) -> np.ndarray:
+        """
+        Scores of the prefixes `parents` extended by `tokens`, -inf for forbidden ones
+        """
+        return self.scores[parents] + self._step(parents, tokens)[1]
+
+    def add(self, nodes: np.ndarray, parents: np.ndarray, tokens: np.ndarray, scores: np.ndarray):
+        """
+        Stores states of the extensions kept in the current frame
+        """
+        if len(self.scores) < len(self.trie.parent):
+            n_new = len(self.trie.parent) - len(self.scores)
+            self.scores = np.concatenate([self.scores, np.zeros(n_new)])
+            self.lexicon_nodes = np.concatenate([self.lexicon_nodes, np.zeros(n_new, dtype=np.int32)])
+        self.scores[nodes] = scores
+        self.lexicon_nodes[nodes] = self._step(parents, tokens)[0]
+
+    def final_scores(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Scores of complete hypotheses: an unfinished last word is out of vocabulary
+        """
+        return self.scores[nodes] + np.where(
+            self._incomplete(self.lexicon_nodes[nodes]), self.constraint.oov_penalty, 0.0
+        )
+
+
+def _prune_tokens(log_probs: np.ndarray, blank: int, top_k: Optional[int], cutoff_prob: float) -> np.ndarray:
+    # non blank tokens worth extending beams with: the most probable ones covering
+    # `cutoff_prob` of the frame probability mass, at most `top_k` of them
+    order = np.argsort(-log_probs)
+    if cutoff_prob < 1.0:
+        n_kept = int(np.searchsorted(np.cumsum(np.exp(log_probs[order])), cutoff_prob)) + 1
+        order = order[:n_kept]
+    if top_k is not None:
+        order = order[:top_k]
+    return order[order != blank]
+
+
+def ctc_prefix_beam_search(log_probs: np.ndarray, beam_size: int = 100, blank: int = 0,
+                           top_k: Optional[int] = None, cutoff_prob: float = 1.0,
+                           blank_skip_threshold: Optional[float] = None,
+                           fusion: Optional[ShallowFusion] = None,
+                           lexicon: Optional[LexiconConstraint] = None) -> List[Tuple[List[int], float]]:
+    """
+    CTC prefix beam search over a (time, voc) matrix of log-probs.
+
+    Every beam keeps the log-probs of its prefix ending in blank and in a non-blank token.
+    All candidates of a frame are scored with array ops and merged by their prefix trie node.
+
+    :param top_k: extend beams with at most `top_k` most probable tokens of a frame
+    :param cutoff_prob: extend beams only with the most probable tokens whose total probability
+        reaches `cutoff_prob`
+    :param blank_skip_threshold: frames with blank probability above it only extend beams
+        with blank, no new prefixes are created
+    :param fusion: word LM whose scores are added to the acoustic scores of prefixes
+    :param lexicon: lexicon the words of prefixes are restricted to
+    :return: (token indices, log-prob) of the final beams, best first
+    """
+    n_frames, voc_size = log_probs.shape
+    log_probs = log_probs.astype(np.float64, copy=False)
+    blank_skip_logp = np.log(blank_skip_threshold) if blank_skip_threshold is not None else np.inf
+
+    trie = _PrefixTrie(voc_size)
+    # scores of prefixes added to the acoustic ones, kept per trie node
+    # the lexicon goes first, so words it forbids are never scored by the LM
+    scorers = [scorer.start(trie) for scorer in (lexicon, fusion) if scorer is not None]
+    nodes = np.array([_ROOT], dtype=np.int32)
+    p_blank = np.array([0.0])
+    p_non_blank = np.array([-np.inf])
+
+    for frame in log_probs:
+        p_total = np.logaddexp(p_blank, p_non_blank)
+        if frame[blank] > blank_skip_logp:
+            # blank dominated frame: repeats of the last tokens are negligible
+            p_blank = p_total + frame[blank]
+            p_non_blank = np.full_like(p_blank, -np.inf)
+            continue
+
+        last = trie.token[nodes]
+        # prefixes stay the same: blank, or a repeat of the last token collapsed into it
+        stay_non_blank = p_non_blank + np.where(last >= 0, frame[np.maximum(last, 0)], -np.inf)
+        stay_blank = p_total + frame[blank]
+
+        # prefixes extended by one token; a repeated token only counts after a blank
+        tokens = _prune_tokens(frame, blank, top_k, cutoff_prob)
+        ext_parents = np.repeat(nodes, len(tokens))
+        ext_tokens = np.tile(tokens, len(nodes))
+        ext_scores = (np.where(
+            last[:, None] == tokens[None, :], p_blank[:, None], p_total[:, None]
+        ) + frame[tokens][None, :]).reshape(-1)
+        # forbidden extensions (-inf) are dropped before the next scorer sees them
+        ext_total = ext_scores
+        scorer_scores = []
+        for scorer in scorers:
+            allowed = ext_total > -np.inf
+            ext_parents, ext_tokens, ext_scores, ext_total = \
+                ext_parents[allowed], ext_tokens[allowed], ext_scores[allowed], ext_total[allowed]
+            scorer_scores = [scores[allowed] for scores in scorer_scores]
+            scorer_scores.append(scorer.extension_scores(ext_parents, ext_tokens))
+            ext_total = ext_total + scorer_scores[-1]
+        # an extension that doesn't merge into a current beam keeps its score,
+        # so only the best `beam_size` of those can survive the frame
+        merges = np.isin(trie.children[ext_parents, ext_tokens], nodes)
+        new = np.flatnonzero(~merges & (ext_total > -np.inf))
+        if len(new) > beam_size:
+            new = new[np.argpartition(-ext_total[new], beam_size)[:beam_size]]
+        kept = np.concatenate([np.flatnonzero(merges), new])
+        ext_nodes = trie.extend(ext_parents[kept], ext_tokens[kept])
+        ext_scores = ext_scores[kept]
+        for scorer, scores in zip(scorers, scorer_scores):
+            scorer.add(ext_nodes, ext_parents[kept], ext_tokens[kept], scores[kept])
+
+        # merge equal prefixes
+        all_nodes = np.concatenate([nodes, ext_nodes])
+        merged_nodes, inverse = np.unique(all_nodes, return_inverse=True)
+        p_blank = np.full(len(merged_nodes), -np.inf)
+        p_non_blank = np.full(len(merged_nodes), -np.inf)
+        np.logaddexp.at(p_blank, inverse[:len(nodes)], stay_blank)
+        np.logaddexp.at(p_non_blank, inverse, np.concatenate([stay_non_blank, ext_scores]))
+
+        # keep the best beams
+        p_total = np.logaddexp(p_blank, p_non_blank)
+        for scorer in scorers:
+            p_total = p_total + scorer.scores[merged_nodes]
+        if len(merged_nodes) > beam_size:
+            best = np.argpartition(-p_total, beam_size)[:beam_size]
+            merged_nodes, p_blank, p_non_blank = merged_nodes[best], p_blank[best], p_non_blank[best]
+        nodes = merged_nodes.astype(np.int32)
+
+    p_total = np.logaddexp(p_blank, p_non_blank)
+    for scorer in scorers:
+        p_total = p_total + scorer.final_scores(nodes)
+    order = np.argsort(-p_total)
+    return [(trie.get_tokens(int(nodes[i])), float(p_total[i])) for i in order]
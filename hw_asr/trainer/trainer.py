@@ -8,8 +8,10 @@ from torch.nn.utils import clip_grad_norm_
 from torchvision.transforms import ToTensor
 from tqdm import tqdm
 
+import hw_asr.augmentations
 from hw_asr.base import BaseTrainer
 from hw_asr.base.base_text_encoder import BaseTextEncoder
+from hw_asr.frontend import LogMelFrontend
 from hw_asr.logger.utils import plot_spectrogram_to_buf
 from hw_asr.metric.utils import calc_cer, calc_wer
 from hw_asr.utils import inf_loop, MetricTracker
@@ -52,6 +54,15 @@ class Trainer(BaseTrainer):
         self.lr_scheduler = lr_scheduler
         self.log_step = 10
 
+        self.frontend = None
+        if config["preprocessing"].get("batch_frontend", False):
+            # datasets return waveforms, spectrograms are computed here on the training device
+            spec_augs = hw_asr.augmentations.batch_spec_from_configs(config)
+            self.frontend = LogMelFrontend(config, spec_augs=spec_augs).to(device)
+        self.batch_wave_augs, self.batch_spec_augs = hw_asr.augmentations.batch_from_configs(config)
+        assert self.batch_wave_augs is None or self.frontend is not None, \
+            "Batch wave augmentations need waveforms in batches, set preprocessing.batch_frontend"
+
         self.train_metrics = MetricTracker(
             "loss", "grad norm", *[m.name for m in self.metrics], writer=self.writer
         )
@@ -64,8 +75,10 @@ class Trainer(BaseTrainer):
         """
         Move all necessary tensors to the HPU
         """
-        for tensor_for_gpu in ["spectrogram", "text_encoded"]:
-            batch[tensor_for_gpu] = batch[tensor_for_gpu].to(device)
+        for tensor_for_gpu in ["spectrogram", "audio", "text_encoded"]:
+            if tensor_for_gpu in batch:
+                # asynchronous when the DataLoader pins memory
+                batch[tensor_for_gpu] = batch[tensor_for_gpu].to(device, non_blocking=True)
         return batch
 
     def _clip_grad_norm(self):
@@ -129,6 +142,16 @@ class Trainer(BaseTrainer):
 
     def process_batch(self, batch, is_train: bool, metrics: MetricTracker):
         batch = self.move_batch_to_device(batch, self.device)
+        with torch.no_grad():
+            if is_train and self.batch_wave_augs is not None:
+                batch["audio"], batch["audio_length"] = self.batch_wave_augs(batch["audio"], batch["audio_length"])
+            if self.frontend is not None:
+                self.frontend.train(is_train)
+                batch.update(self.frontend(**batch))
+            if is_train and self.batch_spec_augs is not None:
+                batch["spectrogram"], batch["spectrogram_length"] = self.batch_spec_augs(
+                    batch["spectrogram"], batch["spectrogram_length"]
+                )
         if is_train:
             self.optimizer.zero_grad()
         outputs = self.model(**batch)
@@ -205,13 +228,12 @@ class Trainer(BaseTrainer):
     ):
         if self.writer is None:
             return
-        argmax_inds = log_probs.cpu().argmax(-1)
-        argmax_inds = [
-            inds[: int(ind_len)]
+        argmax_inds = log_probs.detach().argmax(-1).cpu()
+        argmax_texts = self.text_encoder.ctc_decode_batch(argmax_inds, log_probs_length)
+        argmax_texts_raw = [
+            self.text_encoder.decode(inds[: int(ind_len)])
             for inds, ind_len in zip(argmax_inds, log_probs_length)
         ]
-        argmax_texts_raw = [self.text_encoder.decode(inds) for inds in argmax_inds]
-        argmax_texts = [self.text_encoder.ctc_decode(inds) for inds in argmax_inds]
         tuples = list(zip(argmax_texts, text, argmax_texts_raw))
         shuffle(tuples)
         to_log_pred = []
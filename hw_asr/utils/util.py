@@ -1,10 +1,12 @@
 import json
 from collections import OrderedDict
+from functools import lru_cache
 from itertools import repeat
 from pathlib import Path
 
 import pandas as pd
 import torch
+import torchaudio
 
 ROOT_PATH = Path(__file__).absolute().resolve().parent.parent.parent
 
@@ -33,6 +35,15 @@ def inf_loop(data_loader):
         yield from loader
 
 
+@lru_cache(maxsize=None)
+def get_resampler(orig_sr: int, new_sr: int, device: str = "cpu") -> torchaudio.transforms.Resample:
+    """
+    Resample module for a pair of sample rates. Its sinc kernel is computed once per process
+    (i.e. per DataLoader worker) instead of on every `torchaudio.functional.resample` call.
+    """
+    return torchaudio.transforms.Resample(orig_freq=orig_sr, new_freq=new_sr).to(device)
+
+
 def prepare_device(n_gpu_use):
     """
     setup GPU device if available. get gpu device indices which are used for DataParallel
@@ -8,6 +8,7 @@ from tqdm import tqdm
 
 import hw_asr.model as module_model
 from hw_asr.datasets.utils import get_dataloaders
+from hw_asr.frontend import LogMelFrontend
 from hw_asr.metric.utils import calc_wer, calc_cer
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
 from hw_asr.trainer import Trainer
@@ -42,6 +43,10 @@ def main(config, out_file):
     model = model.to(device)
     model.eval()
 
+    frontend = None
+    if config["preprocessing"].get("batch_frontend", False):
+        frontend = LogMelFrontend(config).to(device).eval()
+
     results = []
     cer_list_greedy = []
     cer_list_beam = []
@@ -50,6 +55,8 @@ def main(config, out_file):
     with torch.no_grad():
         for batch_num, batch in enumerate(tqdm(dataloaders["val"])):
             batch = Trainer.move_batch_to_device(batch, device)
+            if frontend is not None:
+                batch.update(frontend(**batch))
             output = model(**batch)
             if type(output) is dict:
                 batch.update(output)
@@ -61,13 +68,12 @@ def main(config, out_file):
             )
             batch["probs"] = batch["log_probs"].exp().cpu()
             batch["argmax"] = batch["probs"].argmax(-1)
+            pred_texts_argmax = text_encoder.ctc_decode_batch(batch["argmax"], batch["log_probs_length"])
             for i in range(len(batch["text"])):
-                argmax = batch["argmax"][i]
-                argmax = argmax[:int(batch["log_probs_length"][i])]
                 results.append(
                     {
                         "ground_truth": batch["text"][i],
-                        "pred_text_argmax": text_encoder.ctc_decode(argmax),
+                        "pred_text_argmax": pred_texts_argmax[i],
                         "pred_text_beam_search": text_encoder.ctc_beam_search(
                             batch["probs"][i], batch["log_probs_length"][i], beam_size=100
                         )[:10],
@@ -7,7 +7,9 @@ import torch
 from tqdm import tqdm
 
 import hw_asr.model as module_model
+from hw_asr.datasets.custom_dir_audio_dataset import default_index_cache_path
 from hw_asr.datasets.utils import get_dataloaders
+from hw_asr.frontend import LogMelFrontend
 from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
 from hw_asr.trainer import Trainer
 from hw_asr.utils import ROOT_PATH
@@ -16,7 +18,8 @@ from hw_asr.utils.parse_config import ConfigParser
 DEFAULT_CHECKPOINT_PATH = ROOT_PATH / "default_test_model" / "checkpoint.pth"
 
 
-def main(config, out_file):
+def main(config, out_file, beam_search_jobs=None, lm_path=None, alpha=0.5, beta=1.0,
+         lexicon_path=None, oov_penalty=-10.0):
     logger = config.get_logger("test")
 
     # text_encoder
@@ -41,11 +44,25 @@ def main(config, out_file):
     model = model.to(device)
     model.eval()
 
+    frontend = None
+    if config["preprocessing"].get("batch_frontend", False):
+        frontend = LogMelFrontend(config).to(device).eval()
+
+    if lm_path is not None:
+        text_encoder.set_language_model(lm_path, alpha=alpha, beta=beta)
+    if lexicon_path is not None:
+        text_encoder.set_lexicon(lexicon_path, oov_penalty=oov_penalty)
+
+    # decoding of a batch runs in the pool while the model processes the next batches
+    text_encoder.get_beam_search_pool(beam_search_jobs)
+
     results = []
 
     with torch.no_grad():
         for batch_num, batch in enumerate(tqdm(dataloaders["test"])):
             batch = Trainer.move_batch_to_device(batch, device)
+            if frontend is not None:
+                batch.update(frontend(**batch))
             output = model(**batch)
             if type(output) is dict:
                 batch.update(output)
@@ -55,20 +72,22 @@ def main(config, out_file):
             batch["log_probs_length"] = model.transform_input_lengths(
                 batch["spectrogram_length"]
             )
-            batch["probs"] = batch["log_probs"].exp().cpu()
-            batch["argmax"] = batch["probs"].argmax(-1)
+            batch["argmax"] = batch["log_probs"].argmax(-1)
+            pred_texts_argmax = text_encoder.ctc_decode_batch(batch["argmax"], batch["log_probs_length"])
+            beam_search_futures = text_encoder.ctc_beam_search_batch(
+                batch["log_probs"], batch["log_probs_length"], beam_size=100
+            )
             for i in range(len(batch["text"])):
-                argmax = batch["argmax"][i]
-                argmax = argmax[:int(batch["log_probs_length"][i])]
                 results.append(
                     {
                         "ground_trurh": batch["text"][i],
-                        "pred_text_argmax": text_encoder.ctc_decode(argmax),
-                        "pred_text_beam_search": text_encoder.ctc_beam_search(
-                            batch["probs"][i], batch["log_probs_length"][i], beam_size=100
-                        )[:10],
+                        "pred_text_argmax": pred_texts_argmax[i],
+                        "pred_text_beam_search": beam_search_futures[i],
                     }
                 )
+    for result in results:
+        result["pred_text_beam_search"] = result["pred_text_beam_search"].result()
+    text_encoder.close()
     with Path(out_file).open("w") as f:
         json.dump(results, f, indent=2)
 
@@ -124,6 +143,42 @@ if __name__ == "__main__":
         type=int,
         help="Number of workers for test dataloader",
     )
+    args.add_argument(
+        "--beam-search-jobs",
+        default=None,
+        type=int,
+        help="Number of beam search processes (default: number of CPUs)",
+    )
+    args.add_argument(
+        "--lm-path",
+        default=None,
+        type=str,
+        help="Word n-gram language model (.arpa) fused into beam search (default: None)",
+    )
+    args.add_argument(
+        "--alpha",
+        default=0.5,
+        type=float,
+        help="Language model weight",
+    )
+    args.add_argument(
+        "--beta",
+        default=1.0,
+        type=float,
+        help="Word insertion bonus",
+    )
+    args.add_argument(
+        "--lexicon-path",
+        default=None,
+        type=str,
+        help="File with one word per line, beam search hypotheses are restricted to its words (default: None)",
+    )
+    args.add_argument(
+        "--oov-penalty",
+        default=-10.0,
+        type=float,
+        help="Score of every word out of the lexicon",
+    )
 
     args = args.parse_args()
 
@@ -158,6 +213,10 @@ if __name__ == "__main__":
                             "transcription_dir": str(
                                 test_data_folder / "transcriptions"
                             ),
+                            # probed lengths are kept in the user cache dir between runs
+                            "index_cache_path": str(
+                                default_index_cache_path(test_data_folder / "audio")
+                            ),
                         },
                     }
                 ],
@@ -168,4 +227,5 @@ if __name__ == "__main__":
     config["data"]["test"]["batch_size"] = args.batch_size
     #config["data"]["test"]["n_jo"] = args.n_jobs
 
-    main(config, args.output)
+    main(config, args.output, args.beam_search_jobs, args.lm_path, args.alpha, args.beta,
+         args.lexicon_path, args.oov_penalty)
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+
+import hw_asr.model as module_model
+from hw_asr.batch_sampler import GroupLengthBatchSampler
+from hw_asr.collate_fn.collate import collate_fn, collated_fields
+from hw_asr.datasets import CustomAudioDataset
+from hw_asr.datasets.custom_dir_audio_dataset import AUDIO_SUFFIXES, default_index_cache_path
+from hw_asr.frontend import LogMelFrontend
+from hw_asr.text_encoder.ctc_char_text_encoder import CTCCharTextEncoder
+from hw_asr.trainer import Trainer
+from hw_asr.utils import ROOT_PATH
+from hw_asr.utils.parse_config import ConfigParser
+
+DEFAULT_CHECKPOINT_PATH = ROOT_PATH / "default_test_model" / "checkpoint.pth"
+
+
+def load_processed(out_file) -> set:
+    """
+    Paths already written to the output stream (one json object per line)
+    """
+    processed = set()
+    if not Path(out_file).exists():
+        return processed
+    with Path(out_file).open() as f:
+        for line in f:
+            try:
+                processed.add(json.loads(line)["path"])
+            except json.JSONDecodeError:
+                # a line cut by a crash, its file is processed again
+                continue
+    return processed
+
+
+class FolderWatcher:
+    """
+    Finds new audio files in a directory. A file is ready once its size and mtime
+    didn't change between two polls, so files that are still being written are skipped.
+    Files that failed `max_retries` times are skipped until the watcher is restarted.
+    """
+
+    def __init__(self, audio_dir, processed: set, wait_stable: bool = True, max_retries: int = 3):
+        self.audio_dir = Path(audio_dir)
+        self.processed = processed
+        self.wait_stable = wait_stable
+        self.max_retries = max_retries
+        self.failures = {}
+        self._last_stats = {}
+
+    def mark_failed(self, path) -> bool:
+        """
+        Counts a failure of `path`, returns True if it won't be retried anymore
+        """
+        self.failures[path] = self.failures.get(path, 0) + 1
+        return self.failures[path] >= self.max_retries
+
+    def poll(self):
+        ready = []
+        stats = {}
+        for path in self.audio_dir.iterdir():
+            path = str(path.absolute().resolve())
+            if Path(path).suffix not in AUDIO_SUFFIXES or path in self.processed:
+                continue
+            if self.failures.get(path, 0) >= self.max_retries:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats[path] = (stat.st_size, stat.st_mtime)
+            if stat.st_size > 0 and (not self.wait_stable or self._last_stats.get(path) == stats[path]):
+                ready.append(path)
+        self._last_stats = stats
+        return sorted(ready)
+
+
+def main(config, audio_dir, out_file, interval, batch_size, jobs, once):
+    logger = config.get_logger("watch")
+
+    # text_encoder
+    text_encoder = CTCCharTextEncoder.get_simple_alphabet()
+
+    # build model architecture
+    model = config.init_obj(config["arch"], module_model, n_class=len(text_encoder))
+
+    logger.info("Loading checkpoint: {} ...".format(config.resume))
+    checkpoint = torch.load(config.resume)
+    state_dict = checkpoint["state_dict"]
+    if config["n_gpu"] > 1:
+        model = torch.nn.DataParallel(model)
+    model.load_state_dict(state_dict)
+
+    # prepare model for inference, it stays loaded for the whole run
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = model.to(device)
+    model.eval()
+
+    batch_frontend = config["preprocessing"].get("batch_frontend", False)
+    frontend = None
+    if batch_frontend:
+        frontend = LogMelFrontend(config).to(device).eval()
+
+    watcher = FolderWatcher(audio_dir, load_processed(out_file), wait_stable=not once)
+    # probed lengths of the watched directory are kept in the user cache dir
+    index_cache_path = default_index_cache_path(audio_dir)
+    logger.info(f"Watching {audio_dir}, {len(watcher.processed)} files are already processed")
+
+    if Path(out_file).exists() and Path(out_file).stat().st_size > 0:
+        with Path(out_file).open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            ends_with_newline = f.read() == b"\n"
+        if not ends_with_newline:
+            # don't glue new results to a line cut by a crash
+            with Path(out_file).open("a") as out:
+                out.write("\n")
+
+    with Path(out_file).open("a") as out:
+
+        def transcribe(paths):
+            dataset = CustomAudioDataset(
+                [{"path": path} for path in paths], index_cache_path=index_cache_path,
+                text_encoder=text_encoder, config_parser=config,
+                fields=collated_fields(batch_frontend) + ["audio_path"],
+            )
+            # records of similar lengths are batched together, order doesn't matter here
+            batch_sampler = GroupLengthBatchSampler(dataset, batch_size=batch_size, shuffle=False)
+            dataloader = torch.utils.data.DataLoader(
+                dataset, batch_sampler=batch_sampler, collate_fn=collate_fn, num_workers=jobs
+            )
+            with torch.no_grad():
+                for batch in dataloader:
+                    batch = Trainer.move_batch_to_device(batch, device)
+                    if frontend is not None:
+                        batch.update(frontend(**batch))
+                    output = model(**batch)
+                    logits = output["logits"] if type(output) is dict else output
+                    log_probs_length = model.transform_input_lengths(batch["spectrogram_length"])
+                    pred_texts = text_encoder.ctc_decode_batch(logits.argmax(-1), log_probs_length)
+                    for path, pred_text in zip(batch["audio_path"], pred_texts):
+                        result = {"path": path, "pred_text_argmax": pred_text}
+                        out.write(json.dumps(result) + "\n")
+                        watcher.processed.add(path)
+                    # results of a batch are durable before the next one starts
+                    out.flush()
+                    os.fsync(out.fileno())
+
+        while True:
+            ready = watcher.poll()
+            if len(ready) > 0:
+                try:
+                    transcribe(ready)
+                except Exception:
+                    logger.exception(f"Failed to process {len(ready)} new files, retrying them one by one")
+                    # a broken file fails alone, the rest of the poll is still processed
+                    for path in ready:
+                        if path in watcher.processed:
+                            continue
+                        try:
+                            transcribe([path])
+                        except Exception as e:
+                            if watcher.mark_failed(path):
+                                logger.error(f"Giving up on {path} after {watcher.max_retries} failures: {e}")
+                            else:
+                                logger.warning(f"Failed to process {path}, it is retried on the next poll: {e}")
+                n_processed = sum(path in watcher.processed for path in ready)
+                logger.info(f"Processed {n_processed} of {len(ready)} new files")
+            if once:
+                break
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Transcribe audio files as they appear in a directory")
+    args.add_argument(
+        "audio_dir",
+        type=str,
+        help="directory to watch",
+    )
+    args.add_argument(
+        "-c",
+        "--config",
+        default=None,
+        type=str,
+        help="config file path (default: None)",
+    )
+    args.add_argument(
+        "-r",
+        "--resume",
+        default=str(DEFAULT_CHECKPOINT_PATH.absolute().resolve()),
+        type=str,
+        help="path to latest checkpoint (default: None)",
+    )
+    args.add_argument(
+        "-d",
+        "--device",
+        default=None,
+        type=str,
+        help="indices of GPUs to enable (default: all)",
+    )
+    args.add_argument(
+        "-o",
+        "--output",
+        default="output.jsonl",
+        type=str,
+        help="File to append results to (.jsonl), files listed in it are never processed again",
+    )
+    args.add_argument(
+        "-i",
+        "--interval",
+        default=5.0,
+        type=float,
+        help="Seconds between directory polls",
+    )
+    args.add_argument(
+        "-b",
+        "--batch-size",
+        default=20,
+        type=int,
+        help="Inference batch size",
+    )
+    args.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of dataloader workers",
+    )
+    args.add_argument(
+        "--once",
+        action="store_true",
+        help="Process files present now and exit",
+    )
+
+    args = args.parse_args()
+
+    # set GPUs
+    if args.device is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = args.device
+
+    # model config is located with checkpoint in the same folder
+    model_config = Path(args.resume).parent / "config.json"
+    with model_config.open() as f:
+        config = ConfigParser(json.load(f), resume=args.resume)
+
+    # update with addition configs from `args.config` if provided
+    if args.config is not None:
+        with Path(args.config).open() as f:
+            config.config.update(json.load(f))
+
+    main(config, Path(args.audio_dir).absolute().resolve(), args.output, args.interval,
+         args.batch_size, args.jobs, args.once)